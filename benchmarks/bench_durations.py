@@ -0,0 +1,45 @@
+import time
+
+import isodate
+
+from benchmarks.synthetic import azure_payload
+from wudpecker_transcribe.azure import PTtoSec, word_times
+
+# python -m benchmarks.bench_durations
+
+
+def isodate_times(words):
+    times = []
+    for word in words:
+        times.append((
+            isodate.parse_duration(word["offset"]).total_seconds(),
+            isodate.parse_duration(word["offset"]).total_seconds()
+            + isodate.parse_duration(word["duration"]).total_seconds(),
+        ))
+    return times
+
+
+def timed(fn, phrases):
+    start = time.perf_counter()
+    result = [fn(phrase["nBest"][0]["words"]) for phrase in phrases]
+    return time.perf_counter() - start, result
+
+
+def main(words=50000):
+    phrases = azure_payload(words=words)["recognizedPhrases"]
+
+    baseline, expected = timed(isodate_times, phrases)
+    PTtoSec.cache_clear()
+    cold, result = timed(word_times, phrases)
+    warm, _ = timed(word_times, phrases)
+    assert result == expected
+
+    print(f"{words} words, {len(phrases)} phrases")
+    print(f"isodate            {baseline * 1000:8.1f} ms")
+    print(f"PTtoSec (cold)     {cold * 1000:8.1f} ms  x{baseline / cold:.1f}")
+    print(f"PTtoSec (cached)   {warm * 1000:8.1f} ms  x{baseline / warm:.1f}")
+    print(f"cache              {PTtoSec.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
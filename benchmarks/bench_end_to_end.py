@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+import uuid as uuidlib
+
+from benchmarks.harness import payload_parser, word_count
+from benchmarks.standins import ProviderStandIn
+from benchmarks.synthetic import azure_payload, deepgram_payload, recall_timeline
+
+# python -m benchmarks.bench_end_to_end --jobs 200 --concurrency 32 --minutes 45
+# Throughput of the Celery tasks end to end: a worker and the callback
+# dispatcher in this process run Deepgram and Azure jobs against local
+# stand-ins for the providers, Recall and the callbacks, with S3 served by a
+# local moto server. Needs a Redis
+# server (REDIS_URL, database --redis-db) and moto[server]
+# (benchmarks/requirements.txt).
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def stage_summary():
+    from prometheus_client import REGISTRY
+    for metric in REGISTRY.collect():
+        if not metric.name.startswith("wudpecker_") or metric.type != "histogram":
+            continue
+        sums = {}
+        counts = {}
+        for sample in metric.samples:
+            labels = ",".join(f"{k}={v}" for k, v in sorted(sample.labels.items()) if k != "le")
+            if sample.name.endswith("_sum"):
+                sums[labels] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[labels] = sample.value
+        for labels, count in sorted(counts.items()):
+            if count:
+                name = f"{metric.name}{{{labels}}}" if labels else metric.name
+                print(f"  {name:<75} n={int(count):<6} mean={sums[labels] / count:.4f}", flush=True)
+
+
+def configure(standin, args, s3_url):
+    os.environ.setdefault("REDIS_URL", "localhost")
+    os.environ.update({
+        "REDIS_STATE_DB": str(args.redis_db),
+        "DEEPGRAM_API_URL": standin.url,
+        "AZURE_SPEECH_URL": standin.url,
+        "RECALL_API_URL": standin.url,
+        "DEEPGRAM_TOKEN": standin.url + "/token",
+        "PROD_DEEPGRAM": "standin",
+        "AZURE_KEY": "standin",
+        "RECALL_TOKEN": "standin",
+        "CREATED_CALLBACK_URL": standin.url + "/callback/created",
+        "DONE_CALLBACK_URL": standin.url + "/callback/done",
+        "FAILED_CALLBACK_URL": standin.url + "/callback/failed",
+        "FAIL_CALLBACK": standin.url + "/callback/fail",
+        "RESULT_CACHE_TTL": "0",
+        "LONG_AUDIO_SECONDS": "0",
+        "S3_ENDPOINT_URL": s3_url,
+        "BUCKET_NAME": "wudpecker-bench",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    })
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+def main():
+    parser = payload_parser("End to end Celery throughput against local stand-ins")
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--azure-share", type=float, default=0.3, help="fraction of jobs sent to Azure")
+    parser.add_argument("--concurrency", type=int, default=16, help="worker threads")
+    parser.add_argument("--latency", type=float, default=0.2, help="provider response delay in seconds")
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+    words = word_count(args)
+
+    deepgram = deepgram_payload(words=words, speakers=args.speakers, seed=args.seed)
+    azure = azure_payload(words=words, speakers=args.speakers, seed=args.seed)
+    recall = recall_timeline(deepgram["metadata"]["duration"], seed=args.seed)
+    standin = ProviderStandIn(deepgram, azure, recall, latency=args.latency).start()
+
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    s3_server = ThreadedMotoServer(ip_address="127.0.0.1", port=free_port(), verbose=False)
+    s3_server.start()
+    configure(standin, args, f"http://127.0.0.1:{s3_server._port}")
+
+    # imported once the environment points at the stand-ins
+    from celery.contrib.testing.worker import start_worker
+    from wudpecker_transcribe import broker, celery_config, http_client, storage
+    from wudpecker_transcribe.callback_dispatcher import dispatch_forever
+    from wudpecker_transcribe.redis_client import redis_url
+
+    app = celery_config.celery_app
+    app.conf.broker_url = redis_url()
+    app.conf.result_backend = redis_url()
+    storage.get_s3().create_bucket(Bucket=os.environ["BUCKET_NAME"])
+    standin.on_created = celery_config.get_transcript.delay
+    queues = [broker.PROVIDER_QUEUE, broker.RESULTS_QUEUE, broker.POSTPROCESS_QUEUE, broker.DELIVERY_QUEUE]
+
+    threading.Thread(target=asyncio.run, args=(dispatch_forever(),), daemon=True).start()
+
+    submitted = {}
+    audio = standin.url + "/audio"
+    azure_every = round(1 / args.azure_share) if args.azure_share > 0 else 0
+    with start_worker(app, pool="threads", concurrency=args.concurrency, perform_ping_check=False,
+                      queues=queues, shutdown_timeout=30):
+        started = time.monotonic()
+        for i in range(args.jobs):
+            uuid = "bench-" + uuidlib.uuid4().hex
+            submitted[uuid] = time.monotonic()
+            if azure_every and i % azure_every == 0:
+                celery_config.create_transcript_manual.delay(uuid, audio, "en-US")
+            else:
+                celery_config.deepgram_transcribe.delay(uuid, audio, ["en"])
+        finished = standin.wait_for(args.jobs, args.timeout)
+        elapsed = time.monotonic() - started
+        # the worker threads share this process's pooled session
+        pool = http_client.pool_stats()
+
+    standin.stop()
+    s3_server.stop()
+
+    latencies = [at - submitted[uuid] for uuid, (_, at) in standin.done.items() if uuid in submitted]
+    statuses = {}
+    for status, _ in standin.done.values():
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{args.jobs} jobs of {words} words, {args.concurrency} worker threads, "
+          f"{args.latency * 1000:.0f} ms provider latency", flush=True)
+    print(f"finished {len(standin.done)} ({statuses}), failed {len(standin.failed)}"
+          f"{'' if finished else ', TIMED OUT'}", flush=True)
+    print(f"wall {elapsed:.2f} s, {len(standin.done) / elapsed:.2f} jobs/s", flush=True)
+    if latencies:
+        print(f"job latency p50 {percentile(latencies, 0.5):.2f} s, p95 {percentile(latencies, 0.95):.2f} s, "
+              f"mean {statistics.mean(latencies):.2f} s", flush=True)
+    print(f"http pool: {pool['requests']} requests, {pool['handshakes']} new connections, "
+          f"{pool['pool_hits']} reused", flush=True)
+    print("stages:", flush=True)
+    stage_summary()
+    for failure in standin.failed[:5]:
+        print("failure:", failure, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import time
+
+# python -m benchmarks.bench_live --sessions 300 --seconds 20
+# Concurrent /live sessions against one API process running the local
+# streaming backend: every client sends 16 kHz 16 bit mono audio in 100 ms
+# frames at real time pace (or --speed times faster) and records when the
+# first segment arrives and when the session is done.
+
+FRAME_SECONDS = 0.1
+BYTES_PER_SECOND = 32000
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def client(session, url, seconds, speed):
+    import aiohttp
+    frame = b"\0" * int(BYTES_PER_SECOND * FRAME_SECONDS)
+    started = time.monotonic()
+    first_segment = None
+    segments = 0
+    async with session.ws_connect(url) as ws:
+
+        async def send():
+            for _ in range(int(seconds / FRAME_SECONDS)):
+                await ws.send_bytes(frame)
+                await asyncio.sleep(FRAME_SECONDS / speed)
+            await ws.send_str('{"type": "CloseStream"}')
+
+        sender = asyncio.ensure_future(send())
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = message.json()
+            if data["type"] == "segments":
+                segments += 1
+                if first_segment is None:
+                    first_segment = time.monotonic() - started
+            elif data["type"] in ("done", "error"):
+                break
+        await sender
+    return first_segment, time.monotonic() - started, segments, data["type"]
+
+
+async def run(args, port):
+    import aiohttp
+    url = f"ws://127.0.0.1:{port}/live"
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(
+            *(client(session, url, args.seconds, args.speed) for _ in range(args.sessions)),
+            return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent live transcription sessions")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10, help="audio per session")
+    parser.add_argument("--speed", type=float, default=1, help="send faster than real time")
+    args = parser.parse_args()
+
+    os.environ["LIVE_BACKEND"] = "local"
+    os.environ.setdefault("LIVE_MAX_SESSIONS", str(args.sessions))
+    import uvicorn
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config("wudpecker_transcribe.main:app", host="127.0.0.1", port=port,
+                                           log_level="warning", ws_max_size=16 * 1024 * 1024))
+
+    async def bench():
+        serving = asyncio.ensure_future(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        started = time.monotonic()
+        results = await run(args, port)
+        elapsed = time.monotonic() - started
+        server.should_exit = True
+        await serving
+        return results, elapsed
+
+    results, elapsed = asyncio.run(bench())
+    failures = [r for r in results if isinstance(r, BaseException) or r[3] != "done"]
+    finished = [r for r in results if not isinstance(r, BaseException) and r[3] == "done"]
+    first = [r[0] for r in finished if r[0] is not None]
+    print(f"{args.sessions} sessions of {args.seconds:.0f} s audio at {args.speed}x, wall {elapsed:.2f} s", flush=True)
+    print(f"finished {len(finished)}, failed {len(failures)}", flush=True)
+    if first:
+        print(f"first segment p50 {percentile(first, 0.5) * 1000:.0f} ms, p95 {percentile(first, 0.95) * 1000:.0f} ms, "
+              f"mean {statistics.mean(first) * 1000:.0f} ms", flush=True)
+        print(f"segments per session {statistics.mean(r[2] for r in finished):.1f}", flush=True)
+    for failure in failures[:5]:
+        print("failure:", failure, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from concurrent.futures import Future
+
+from benchmarks.harness import best_of, payload_parser, report, word_count
+from benchmarks.synthetic import azure_payload, deepgram_payload, recall_timeline
+from wudpecker_transcribe import serialization
+from wudpecker_transcribe.azure import AZURE_STREAM_CHUNK, parse_azure, parse_azure_stream
+from wudpecker_transcribe.celery_config import get_matched_speakers, parse_deepgram, speaker_segments
+from wudpecker_transcribe.speakers import speaker_name_map
+from wudpecker_transcribe.transcript_model import Transcript
+
+# python -m benchmarks.bench_parsers --minutes 120 --speakers 6
+# Time and peak memory of every CPU stage between the provider response and
+# the upload. ParseAzure + combine_multiple_segments are now parse_azure /
+# parse_azure_stream, make_speaker_matcher is match_speakers behind
+# get_matched_speakers.
+
+
+def chunked(data, size=AZURE_STREAM_CHUNK):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def done_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def main():
+    args = payload_parser("Parse and speaker matching stages").parse_args()
+    words = word_count(args)
+
+    deepgram = deepgram_payload(words=words, speakers=args.speakers, seed=args.seed)
+    azure = azure_payload(words=words, speakers=args.speakers, seed=args.seed)
+    azure_bytes = serialization.dumps(azure)
+    transcript = Transcript.from_deepgram(deepgram)
+    timeline = recall_timeline(transcript.seg_end[-1], seed=args.seed)
+    print(f"{words} words, {args.speakers} speakers, {len(transcript)} segments, "
+          f"{len(timeline)} Recall events, Azure document {len(azure_bytes) / (1024 * 1024):.1f} MB", flush=True)
+
+    report("parse_deepgram", *best_of(lambda: parse_deepgram(deepgram), args.repeat)[1:])
+    report("Transcript.from_deepgram", *best_of(lambda: Transcript.from_deepgram(deepgram), args.repeat)[1:])
+    report("parse_azure (decoded document)", *best_of(lambda: parse_azure(azure), args.repeat)[1:])
+    report("parse_azure_stream (64KB chunks)", *best_of(lambda: parse_azure_stream(chunked(azure_bytes)), args.repeat)[1:])
+
+    speakers, elapsed, peak = best_of(lambda: get_matched_speakers("bench", transcript, done_future(timeline)), args.repeat)
+    report("get_matched_speakers", elapsed, peak)
+    assert speakers, "no speaker matched the synthetic timeline"
+
+    formatted = transcript.to_wudpecker()
+    report("speaker_segments", *best_of(lambda: speaker_segments(formatted, speakers), args.repeat)[1:])
+    report("to_wudpecker(speaker names)", *best_of(lambda: transcript.to_wudpecker(speaker_name_map(speakers)), args.repeat)[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import json
+import time
+
+from benchmarks.synthetic import deepgram_payload
+from wudpecker_transcribe import serialization
+from wudpecker_transcribe.transcript_model import Transcript
+
+# python -m benchmarks.bench_serialization
+# Decodes a Deepgram response and encodes the formatted transcript with
+# every installed backend, compared to the old text based stdlib path.
+
+
+def best_of(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(words=60000):
+    raw = json.dumps(deepgram_payload(words=words)).encode("utf-8")
+    formatted = Transcript.from_deepgram(json.loads(raw)).to_wudpecker()
+    encoded = len(json.dumps(formatted))
+    print(f"response {len(raw) / 1e6:.1f} MB, transcript {encoded / 1e6:.1f} MB")
+
+    baseline_load = best_of(lambda: json.loads(raw.decode("utf-8")))
+    baseline_dump = best_of(lambda: json.dumps(formatted).encode("UTF-8"))
+    print(f"{'text + json':14}{baseline_load * 1000:8.1f} ms load{baseline_dump * 1000:8.1f} ms dump")
+
+    backends = ["json"] + [name for name in ("orjson", "ujson") if getattr(serialization, name) is not None]
+    original = serialization.BACKEND
+    try:
+        for backend in backends:
+            serialization.BACKEND = backend
+            load = best_of(lambda: serialization.loads(raw))
+            dump = best_of(lambda: serialization.dumps(formatted))
+            assert serialization.loads(serialization.dumps(formatted)) == formatted
+            print(f"{backend:14}{load * 1000:8.1f} ms load{dump * 1000:8.1f} ms dump"
+                  f"   x{baseline_load / load:.1f} / x{baseline_dump / dump:.1f}")
+    finally:
+        serialization.BACKEND = original
+
+
+if __name__ == "__main__":
+    main()
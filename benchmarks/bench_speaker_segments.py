@@ -0,0 +1,52 @@
+import copy
+
+from benchmarks.harness import measure
+from benchmarks.synthetic import deepgram_payload
+from wudpecker_transcribe.celery_config import speaker_segments
+from wudpecker_transcribe.speakers import speaker_name_map
+from wudpecker_transcribe.transcript_model import Transcript
+
+# python -m benchmarks.bench_speaker_segments
+# Checks that the copy-free speaker annotation produces exactly the output
+# of the previous deepcopy based speaker_segments, and how much it saves.
+
+
+def legacy_speaker_segments(transcript, speakers_mapping):
+    formatted = copy.deepcopy(transcript)
+    for segment in formatted["results"]["speaker_labels"]["segments"]:
+        speaker_label = segment.get("speaker_label")
+        speaker_info = next((s for s in speakers_mapping if s['label'] == speaker_label), None)
+        if speaker_info:
+            speaker_name = speaker_info.get("name", "Unknown")
+            if speaker_name == "Unknown":
+                speaker_name = f"Speaker {int(speaker_label.split('_')[-1])+1}"
+        else:
+            speaker_name = f"Speaker {int(speaker_label.split('_')[-1])+1}"
+        segment["speaker_name"] = speaker_name
+        for item in segment.get("items", []):
+            item.pop("speaker_name", None)
+    return formatted
+
+
+def main(words=40000):
+    transcript = Transcript.from_deepgram(deepgram_payload(words=words, speakers=6))
+    speakers = [
+        {"label": "spk_0", "name": "Alice", "primary": "no"},
+        {"label": "spk_1", "name": "Unknown", "primary": "no"},
+        {"label": "spk_3", "name": "Carol", "primary": "no"},
+    ]
+
+    expected, legacy_time, legacy_peak = measure(lambda: legacy_speaker_segments(transcript.to_wudpecker(), speakers))
+    annotated, dict_time, dict_peak = measure(lambda: speaker_segments(transcript.to_wudpecker(), speakers))
+    direct, direct_time, direct_peak = measure(lambda: transcript.to_wudpecker(speaker_name_map(speakers)))
+    assert expected == annotated == direct
+
+    mb = 1024 * 1024
+    print(f"{words} words, {len(transcript)} segments, outputs identical")
+    print(f"to_wudpecker + deepcopy    {legacy_time * 1000:8.1f} ms {legacy_peak / mb:7.1f} MB peak")
+    print(f"to_wudpecker + in place    {dict_time * 1000:8.1f} ms {dict_peak / mb:7.1f} MB peak")
+    print(f"to_wudpecker(names)        {direct_time * 1000:8.1f} ms {direct_peak / mb:7.1f} MB peak")
+
+
+if __name__ == "__main__":
+    main()
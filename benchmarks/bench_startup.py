@@ -0,0 +1,88 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid as uuidlib
+
+from benchmarks.bench_end_to_end import percentile
+
+# python -m benchmarks.bench_startup --repeat 10
+# Cold start of the API and the workers. Every run is a fresh interpreter:
+# the import time of wudpecker_transcribe.main (API) and celery_config
+# (workers) plus the heavy libraries each of them loaded, and the time from
+# spawning a solo worker to the result of the first task it ran, with the
+# task already waiting in its queue. The time-to-first-task part needs a
+# Redis server (REDIS_URL, database --redis-db); --skip-worker leaves it out.
+
+HEAVY = ("boto3", "botocore", "requests", "isodate", "wudpecker_transcribe.celery_config")
+
+IMPORT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+WORKER = """
+import sys
+from wudpecker_transcribe import celery_config
+app = celery_config.celery_app
+app.conf.broker_url = app.conf.result_backend = sys.argv[1]
+app.worker_main(["worker", "-P", "solo", "-Q", sys.argv[2], "--without-gossip", "--without-mingle",
+                 "--without-heartbeat", "--loglevel=WARNING"])
+"""
+
+
+def import_time(module):
+    output = subprocess.run([sys.executable, "-c", IMPORT.format(module=module, heavy=HEAVY)],
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), output[1] if len(output) > 1 else ""
+
+
+def first_task_time(app, broker_url, timeout):
+    queue = "bench-startup-" + uuidlib.uuid4().hex
+    result = app.send_task("celery.accumulate", args=(1,), queue=queue)
+    started = time.perf_counter()
+    worker = subprocess.Popen([sys.executable, "-c", WORKER, broker_url, queue],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        result.get(timeout=timeout)
+        return time.perf_counter() - started
+    finally:
+        worker.terminate()
+        worker.wait()
+
+
+def summary(name, values, extra=""):
+    print(f"{name:<40} min {min(values) * 1000:8.1f} ms  median {statistics.median(values) * 1000:8.1f} ms  "
+          f"p90 {percentile(values, 0.9) * 1000:8.1f} ms  {extra}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API and worker cold start")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--skip-worker", action="store_true")
+    args = parser.parse_args()
+
+    for module in ("wudpecker_transcribe.main", "wudpecker_transcribe.celery_config"):
+        runs = [import_time(module) for _ in range(args.repeat)]
+        summary(f"import {module}", [elapsed for elapsed, _ in runs], f"loaded: {runs[-1][1] or '-'}")
+
+    if args.skip_worker:
+        return
+    os.environ.setdefault("REDIS_URL", "localhost")
+    os.environ["REDIS_STATE_DB"] = str(args.redis_db)
+    from wudpecker_transcribe.broker import celery_app
+    from wudpecker_transcribe.redis_client import redis_url
+    celery_app.conf.broker_url = celery_app.conf.result_backend = redis_url()
+    runs = [first_task_time(celery_app, redis_url(), args.timeout) for _ in range(args.repeat)]
+    summary("worker spawn to first task result", runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import gc
+import time
+import tracemalloc
+
+from benchmarks.synthetic import deepgram_payload, recall_timeline
+from wudpecker_transcribe.speakers import RecallTimeline, match_speakers
+from wudpecker_transcribe.transcript_model import Transcript
+
+# python -m benchmarks.bench_transcript_model
+# Compares the columnar Transcript with the per-word dict representation the
+# tasks used to carry around until upload.
+
+
+def dict_parse_deepgram(data):
+    # the previous parse_deepgram, kept here as the baseline
+    segments = []
+    speakers = set()
+    for word in data["results"]["channels"][0]["alternatives"][0]["words"]:
+        speakers.add(word["speaker"])
+        label = "spk_" + str(word["speaker"])
+        item = {
+            "start_time": f"{word['start']:.2f}",
+            "end_time": f"{word['end']:.2f}",
+            "speaker_label": label,
+            "content": word["punctuated_word"],
+        }
+        if segments and segments[-1]["speaker_label"] == label:
+            segments[-1]["items"].append(item)
+            segments[-1]["end_time"] = item["end_time"]
+        else:
+            segments.append({"start_time": item["start_time"], "end_time": item["end_time"],
+                             "speaker_label": label, "items": [item]})
+    return {"results": {"speaker_labels": {"speakers": len(speakers), "segments": segments}}}
+
+
+def dict_spans(formatted):
+    for segment in formatted["results"]["speaker_labels"]["segments"]:
+        yield segment["speaker_label"], float(segment["start_time"]), float(segment["end_time"])
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def main(words=40000):
+    data = deepgram_payload(words=words)
+    timeline = RecallTimeline(recall_timeline(data["metadata"]["duration"]))
+
+    formatted, dict_time, dict_mem, dict_peak = measure(lambda: dict_parse_deepgram(data))
+    transcript, model_time, model_mem, model_peak = measure(lambda: Transcript.from_deepgram(data))
+
+    start = time.perf_counter()
+    expected = match_speakers(dict_spans(formatted), timeline)
+    dict_match = time.perf_counter() - start
+    start = time.perf_counter()
+    result = match_speakers(transcript.speaker_spans(), timeline)
+    model_match = time.perf_counter() - start
+    assert result == expected
+
+    mb = 1024 * 1024
+    print(f"{words} words, {len(transcript)} segments")
+    print(f"{'':12}{'parse ms':>10}{'retained MB':>14}{'peak MB':>10}{'match ms':>10}")
+    print(f"{'dicts':12}{dict_time * 1000:10.1f}{dict_mem / mb:14.2f}{dict_peak / mb:10.2f}{dict_match * 1000:10.2f}")
+    print(f"{'columnar':12}{model_time * 1000:10.1f}{model_mem / mb:14.2f}{model_peak / mb:10.2f}{model_match * 1000:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
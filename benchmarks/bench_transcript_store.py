@@ -0,0 +1,76 @@
+import os
+import time
+
+from benchmarks.harness import payload_parser, word_count
+from benchmarks.synthetic import deepgram_payload
+from wudpecker_transcribe.transcript_model import Transcript
+
+# python -m benchmarks.bench_transcript_store --minutes 120
+# Bytes transferred and parse time for a partial view (the first --view
+# minutes) from the monolithic <uuid>_final_.json versus the windowed layout,
+# against an in-process moto S3. Also checks that reading every window gives
+# back exactly the segments of the monolithic document. Needs moto.
+
+
+class CountingBody:
+    def __init__(self, body, counter):
+        self.body = body
+        self.counter = counter
+
+    def read(self, *args):
+        data = self.body.read(*args)
+        self.counter[0] += len(data)
+        return data
+
+
+def main():
+    parser = payload_parser("Windowed transcript layout versus the monolithic JSON")
+    parser.add_argument("--view", type=float, default=5, help="minutes shown by the partial view")
+    args = parser.parse_args()
+
+    os.environ.update({"AWS_ACCESS_KEY_ID": "bench", "AWS_SECRET_ACCESS_KEY": "bench", "AWS_DEFAULT_REGION": "us-east-1",
+                       "BUCKET_NAME": "wudpecker-bench", "S3_ENDPOINT_URL": "https://s3.us-east-1.amazonaws.com"})
+    from moto import mock_aws
+    mock = mock_aws()
+    mock.start()
+    from wudpecker_transcribe import serialization, storage, transcript_store
+
+    s3 = storage.get_s3()
+    s3.create_bucket(Bucket="wudpecker-bench")
+    formatted = Transcript.from_deepgram(deepgram_payload(words=word_count(args), speakers=args.speakers, seed=args.seed)).to_wudpecker()
+    storage.upload_json("bench_final_.json", formatted)
+    header = transcript_store.write("bench", formatted)
+
+    # count what the readers actually download
+    transferred = [0]
+    get_object = s3.get_object
+
+    def counted_get_object(**kwargs):
+        response = get_object(**kwargs)
+        return dict(response, Body=CountingBody(response["Body"], transferred))
+
+    s3.get_object = counted_get_object
+
+    end = args.view * 60
+    start_time = time.perf_counter()
+    document = serialization.loads(s3.get_object(Bucket="wudpecker-bench", Key="bench_final_.json")["Body"].read())
+    full = [s for s in document["results"]["speaker_labels"]["segments"] if float(s["start_time"]) < end]
+    full_time = time.perf_counter() - start_time
+    full_bytes, transferred[0] = transferred[0], 0
+
+    start_time = time.perf_counter()
+    partial = transcript_store.read_range("bench", 0, end)
+    partial_time = time.perf_counter() - start_time
+    partial_bytes, transferred[0] = transferred[0], 0
+
+    assert partial["segments"] == full
+    assert transcript_store.read_range("bench")["segments"] == formatted["results"]["speaker_labels"]["segments"]
+
+    print(f"{header['words']} words, {header['duration'] / 60:.0f} min, {len(header['windows'])} windows, "
+          f"first {args.view:.0f} min: {len(full)} segments (identical)", flush=True)
+    print(f"monolithic JSON  {full_bytes / 1024:9.1f} KB {full_time * 1000:8.1f} ms", flush=True)
+    print(f"windowed layout  {partial_bytes / 1024:9.1f} KB {partial_time * 1000:8.1f} ms", flush=True)
+
+
+if __name__ == "__main__":
+    main()
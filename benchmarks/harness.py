@@ -0,0 +1,48 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.synthetic import words_for_minutes
+
+# Shared helpers for the benchmark scripts: wall time plus tracemalloc peak
+# of a single call, and the payload size options every script accepts.
+
+
+def measure(fn):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def best_of(fn, repeat):
+    # fastest run, peak memory of that run
+    best = None
+    for _ in range(repeat):
+        run = measure(fn)
+        if best is None or run[1] < best[1]:
+            best = run
+    return best
+
+
+def report(name, elapsed, peak):
+    print(f"{name:<40} {elapsed * 1000:9.1f} ms {peak / (1024 * 1024):8.1f} MB peak", flush=True)
+
+
+def payload_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--minutes", type=float, default=60, help="recording length")
+    parser.add_argument("--words", type=int, help="word count, overrides --minutes")
+    parser.add_argument("--speakers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser
+
+
+def word_count(args):
+    return args.words or words_for_minutes(args.minutes)
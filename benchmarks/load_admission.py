@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import uuid as uuidlib
+
+from benchmarks.bench_end_to_end import configure, free_port, percentile
+from benchmarks.harness import payload_parser, word_count
+from benchmarks.standins import ProviderStandIn
+from benchmarks.synthetic import azure_payload, deepgram_payload, recall_timeline
+
+# python -m benchmarks.load_admission --rate 40 --duration 60 --max-load 50
+# Drives the API above what the worker can finish: requests arrive at --rate
+# per second (--bulk-share of them as /deepgram/start/batch) against an API,
+# a worker and the callback dispatcher in this process, with the providers,
+# Recall and the callbacks served by local stand-ins and S3 by moto. Prints
+# per time bucket how many requests were accepted or got a 429, the load the
+# API saw and the latency of the accepted jobs submitted in that bucket.
+# --max-load 0 runs the same load without admission control. Needs a Redis
+# server (REDIS_URL, database --redis-db) and moto[server]
+# (benchmarks/requirements.txt).
+
+
+async def sample_load(admission_control, interval, samples, stop):
+    while not stop.is_set():
+        try:
+            state = dict(admission_control.sample())
+        except Exception:
+            state = {}
+        samples.append((time.monotonic(), state))
+        await asyncio.sleep(interval)
+
+
+async def fire(args, api, admission_control):
+    import aiohttp
+    log = []
+    samples = []
+    stop = asyncio.Event()
+    rng = random.Random(args.seed)
+    standin_base = api["standin"]
+    sampler = asyncio.ensure_future(sample_load(admission_control, args.bucket, samples, stop))
+    pending = []
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        started = time.monotonic()
+        for i in range(int(args.rate * args.duration)):
+            delay = started + i / args.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            bulk = rng.random() < args.bulk_share
+            pending.append(asyncio.ensure_future(
+                submit(session, api["url"], standin_base, bulk, args.batch, log)))
+        await asyncio.gather(*pending, return_exceptions=True)
+    stop.set()
+    await sampler
+    return started, log, samples
+
+
+async def submit(session, api_url, standin_base, bulk, batch, log):
+    jobs = [{"uuid": "load-" + uuidlib.uuid4().hex, "url": standin_base + "/audio", "langs": ["en"]}
+            for _ in range(batch if bulk else 1)]
+    sent = time.monotonic()
+    path = "/deepgram/start/batch" if bulk else "/deepgram/start"
+    async with session.post(api_url + path, json=jobs if bulk else jobs[0]) as response:
+        await response.read()
+    log.append((sent, bulk, response.status, [job["uuid"] for job in jobs]))
+
+
+def report(args, started, log, samples, done):
+    buckets = {}
+    for sent, bulk, status, uuids in log:
+        bucket = buckets.setdefault(int((sent - started) // args.bucket), {
+            "interactive": {}, "bulk": {}, "latencies": {"interactive": [], "bulk": []}})
+        kind = "bulk" if bulk else "interactive"
+        bucket[kind][status] = bucket[kind].get(status, 0) + 1
+        if status == 200:
+            for uuid in uuids:
+                if uuid in done:
+                    bucket["latencies"][kind].append(done[uuid][1] - sent)
+    loads = {}
+    for at, state in samples:
+        loads[int((at - started) // args.bucket)] = state
+
+    def statuses(counts):
+        return " ".join(f"{status}:{count}" for status, count in sorted(counts.items())) or "-"
+
+    def latency(values):
+        if not values:
+            return "-"
+        return f"{percentile(values, 0.5):.1f}/{percentile(values, 0.99):.1f}"
+
+    print(f"{'t (s)':>7}  {'interactive':<16} {'bulk':<16} {'load':>6} {'held':>6}  "
+          f"{'interactive p50/p99 s':<22} bulk p50/p99 s", flush=True)
+    for index in sorted(buckets):
+        bucket = buckets[index]
+        state = loads.get(index, {})
+        load = state.get("depth", 0) + state.get("inflight", 0) if state else "-"
+        print(f"{index * args.bucket:>7.0f}  {statuses(bucket['interactive']):<16} {statuses(bucket['bulk']):<16} "
+              f"{load:>6} {state.get('held', '-'):>6}  {latency(bucket['latencies']['interactive']):<22} "
+              f"{latency(bucket['latencies']['bulk'])}", flush=True)
+
+
+def main():
+    parser = payload_parser("API admission control under overload")
+    parser.add_argument("--rate", type=float, default=20, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--bulk-share", type=float, default=0.5, help="fraction of requests that are bulk batches")
+    parser.add_argument("--batch", type=int, default=5, help="jobs per bulk request")
+    parser.add_argument("--max-load", type=float, default=50, help="ADMISSION_MAX_LOAD, 0 disables admission")
+    parser.add_argument("--bulk-load", type=float, default=None, help="ADMISSION_BULK_LOAD")
+    parser.add_argument("--concurrency", type=int, default=8, help="worker threads")
+    parser.add_argument("--latency", type=float, default=0.5, help="provider response delay in seconds")
+    parser.add_argument("--bucket", type=float, default=5, help="report interval in seconds")
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=600, help="wait for accepted jobs after the load")
+    args = parser.parse_args()
+    words = word_count(args)
+
+    deepgram = deepgram_payload(words=words, speakers=args.speakers, seed=args.seed)
+    azure = azure_payload(words=words, speakers=args.speakers, seed=args.seed)
+    recall = recall_timeline(deepgram["metadata"]["duration"], seed=args.seed)
+    standin = ProviderStandIn(deepgram, azure, recall, latency=args.latency).start()
+
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    s3_server = ThreadedMotoServer(ip_address="127.0.0.1", port=free_port(), verbose=False)
+    s3_server.start()
+    configure(standin, args, f"http://127.0.0.1:{s3_server._port}")
+    os.environ["ADMISSION_MAX_LOAD"] = str(args.max_load)
+    os.environ["ADMISSION_RELEASE_INTERVAL"] = "0.5"
+    if args.bulk_load is not None:
+        os.environ["ADMISSION_BULK_LOAD"] = str(args.bulk_load)
+
+    # imported once the environment points at the stand-ins
+    import uvicorn
+    from celery.contrib.testing.worker import start_worker
+    from wudpecker_transcribe import broker, celery_config, main as api, storage
+    from wudpecker_transcribe.admission import HELD_KEY
+    from wudpecker_transcribe.callback_dispatcher import dispatch_forever
+    from wudpecker_transcribe.redis_client import get_redis, redis_url
+
+    app = celery_config.celery_app
+    app.conf.broker_url = redis_url()
+    app.conf.result_backend = redis_url()
+    api.admission_control.broker_url = app.conf.broker_url
+    get_redis().delete(HELD_KEY)
+    storage.get_s3().create_bucket(Bucket=os.environ["BUCKET_NAME"])
+    standin.on_created = celery_config.get_transcript.delay
+    queues = [broker.PROVIDER_QUEUE, broker.RESULTS_QUEUE, broker.POSTPROCESS_QUEUE, broker.DELIVERY_QUEUE]
+
+    threading.Thread(target=asyncio.run, args=(dispatch_forever(),), daemon=True).start()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+
+    async def load():
+        serving = asyncio.ensure_future(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        result = await fire(args, {"url": f"http://127.0.0.1:{port}", "standin": standin.url}, api.admission_control)
+        accepted = sum(len(uuids) for _, _, status, uuids in result[1] if status == 200)
+        # held jobs are released by the API, keep it serving until they ran
+        await asyncio.get_event_loop().run_in_executor(None, standin.wait_for, accepted, args.timeout)
+        server.should_exit = True
+        await serving
+        return result, accepted
+
+    with start_worker(app, pool="threads", concurrency=args.concurrency, perform_ping_check=False,
+                      queues=queues, shutdown_timeout=30):
+        (started, log, samples), accepted = asyncio.run(load())
+        elapsed = time.monotonic() - started
+
+    standin.stop()
+    s3_server.stop()
+
+    rejected = sum(1 for _, _, status, _ in log if status == 429)
+    print(f"{len(log)} requests at {args.rate:.0f}/s for {args.duration:.0f} s, {args.bulk_share:.0%} bulk "
+          f"batches of {args.batch}, max load {args.max_load:.0f}, {args.concurrency} worker threads, "
+          f"{args.latency * 1000:.0f} ms provider latency", flush=True)
+    print(f"accepted {accepted} jobs, {rejected} requests got 429, finished {len(standin.done)}, "
+          f"failed {len(standin.failed)}, wall {elapsed:.1f} s", flush=True)
+    report(args, started, log, samples, standin.done)
+
+
+if __name__ == "__main__":
+    main()
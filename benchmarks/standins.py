@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+import uuid as uuidlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local HTTP stand-ins for Deepgram, Azure batch transcription, Recall and
+# the wudpecker callbacks. Provider responses are serialised once up front
+# and served after a configurable latency.
+
+TRANSCRIPTIONS = "/speechtotext/v3.1/transcriptions"
+
+
+class ProviderStandIn:
+
+    def __init__(self, deepgram, azure, recall, latency=0.0, on_created=None):
+        self.deepgram = json.dumps(deepgram).encode()
+        self.azure = json.dumps(azure).encode()
+        self.recall = json.dumps(recall).encode()
+        self.latency = latency
+        self.on_created = on_created
+        self.display_names = {}
+        self.done = {}
+        self.failed = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for(self, count, timeout):
+        # until count jobs finished (done or failed)
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while len(self.done) + len(self.failed) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+        return True
+
+    def _record_done(self, uuid, status):
+        with self.changed:
+            self.done[uuid] = (status, time.monotonic())
+            self.changed.notify_all()
+
+    def _record_failed(self, body):
+        with self.changed:
+            self.failed.append(body)
+            self.changed.notify_all()
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return self.rfile.read(length) if length else b""
+
+            def _send(self, body, status=200, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/token":
+                    return self._send(b'"standin-token"')
+                if path.startswith("/api/v1/bot/"):
+                    return self._send(standin.recall)
+                if path == "/audio":
+                    return self._send(b"\0", content_type="audio/wav")
+                if path.startswith(TRANSCRIPTIONS + "/"):
+                    parts = path[len(TRANSCRIPTIONS) + 1:].split("/")
+                    job = parts[0]
+                    base = standin.url + TRANSCRIPTIONS + "/" + job
+                    if len(parts) == 1:
+                        body = {"self": base, "displayName": standin.display_names.get(job, job),
+                                "status": "Succeeded", "links": {"files": base + "/files"}}
+                        return self._send(json.dumps(body).encode())
+                    if parts[1] == "files":
+                        body = {"values": [{"kind": "Transcription", "links": {"contentUrl": base + "/content"}}]}
+                        return self._send(json.dumps(body).encode())
+                    if parts[1] == "content":
+                        return self._send(standin.azure)
+                self._send(b"{}", status=404)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._body()
+                if path == "/v1/listen":
+                    time.sleep(standin.latency)
+                    return self._send(standin.deepgram)
+                if path == TRANSCRIPTIONS:
+                    time.sleep(standin.latency)
+                    job = uuidlib.uuid4().hex
+                    standin.display_names[job] = json.loads(body)["displayName"]
+                    created = {"self": standin.url + TRANSCRIPTIONS + "/" + job, "status": "NotStarted"}
+                    return self._send(json.dumps(created).encode(), status=201)
+                if path == "/callback/created":
+                    self._send(b"{}")
+                    if standin.on_created is not None:
+                        standin.on_created(json.loads(body)["self"])
+                    return
+                if path == "/callback/done":
+                    form = parse_qs(body.decode())
+                    standin._record_done(form["uuid"][0], form["status"][0])
+                    return self._send(b"{}")
+                if path in ("/callback/fail", "/callback/failed"):
+                    standin._record_failed(body.decode())
+                    return self._send(b"{}")
+                self._send(b"{}", status=404)
+
+        return Handler
@@ -0,0 +1,142 @@
+import random
+
+# Synthetic provider payloads shaped like real Azure batch transcription
+# results, sized by number of words / speakers.
+
+VOCABULARY = (
+    "the meeting agenda today we should ship release customer feedback roadmap "
+    "budget quarter design review pipeline latency deploy metrics hiring team "
+    "sprint planning action items follow up next week sounds good thanks"
+).split()
+
+TICKS_PER_SECOND = 10 ** 7
+# conversational speech, used to size payloads by recording length
+WORDS_PER_MINUTE = 150
+
+
+def words_for_minutes(minutes):
+    return max(int(minutes * WORDS_PER_MINUTE), 1)
+
+
+def iso_duration(seconds):
+    ticks = round(seconds * TICKS_PER_SECOND)
+    hours, rest = divmod(ticks, 3600 * TICKS_PER_SECOND)
+    minutes, rest = divmod(rest, 60 * TICKS_PER_SECOND)
+    out = "PT"
+    if hours:
+        out += f"{hours}H"
+    if minutes:
+        out += f"{minutes}M"
+    if rest or out == "PT":
+        # Azure trims trailing zeros and keeps at most 2 decimals for most values
+        out += f"{rest / TICKS_PER_SECOND:.2f}".rstrip("0").rstrip(".") + "S"
+    return out
+
+
+def azure_payload(words=50000, speakers=4, seed=0):
+    rng = random.Random(seed)
+    phrases = []
+    combined = []
+    now = 0.0
+    speaker = 1
+    remaining = words
+    while remaining > 0:
+        count = min(remaining, rng.randint(3, 30))
+        remaining -= count
+        if rng.random() < 0.4:
+            speaker = rng.randint(1, speakers)
+
+        phrase_start = now
+        phrase_words = []
+        for _ in range(count):
+            duration = round(rng.uniform(0.12, 0.7), 2)
+            phrase_words.append({
+                "word": rng.choice(VOCABULARY),
+                "offset": iso_duration(now),
+                "duration": iso_duration(duration),
+                "offsetInTicks": round(now * TICKS_PER_SECOND),
+                "durationInTicks": round(duration * TICKS_PER_SECOND),
+                "confidence": round(rng.uniform(0.6, 1), 2),
+            })
+            now += duration + round(rng.uniform(0, 0.15), 2)
+        lexical = " ".join(w["word"] for w in phrase_words)
+        display = lexical.capitalize() + "."
+        combined.append(display)
+        phrases.append({
+            "recognitionStatus": "Success",
+            "channel": 0,
+            "speaker": speaker,
+            "offset": iso_duration(phrase_start),
+            "duration": iso_duration(now - phrase_start),
+            "offsetInTicks": round(phrase_start * TICKS_PER_SECOND),
+            "durationInTicks": round((now - phrase_start) * TICKS_PER_SECOND),
+            "nBest": [{
+                "confidence": 0.9,
+                "lexical": lexical,
+                "itn": lexical,
+                "maskedITN": lexical,
+                "display": display,
+                "words": phrase_words,
+            }],
+        })
+        now += round(rng.uniform(0.2, 2), 2)
+
+    text = " ".join(combined)
+    return {
+        "source": "https://example.invalid/recording.mp4",
+        "timestamp": "2023-05-01T10:00:00Z",
+        "durationInTicks": round(now * TICKS_PER_SECOND),
+        "duration": iso_duration(now),
+        "combinedRecognizedPhrases": [{
+            "channel": 0,
+            "lexical": text.lower(),
+            "itn": text.lower(),
+            "maskedITN": text.lower(),
+            "display": text,
+        }],
+        "recognizedPhrases": phrases,
+    }
+
+
+def deepgram_payload(words=50000, speakers=4, seed=0):
+    rng = random.Random(seed)
+    out = []
+    now = 0.0
+    speaker = 0
+    for i in range(words):
+        if rng.random() < 0.03:
+            speaker = rng.randrange(speakers)
+        duration = rng.uniform(0.12, 0.7)
+        word = rng.choice(VOCABULARY)
+        out.append({
+            "word": word,
+            "start": now,
+            "end": now + duration,
+            "confidence": rng.uniform(0.6, 1),
+            "speaker": speaker,
+            "speaker_confidence": rng.uniform(0.3, 1),
+            "punctuated_word": word.capitalize() + "." if rng.random() < 0.08 else word,
+        })
+        now += duration + rng.uniform(0, 0.3)
+    return {
+        "metadata": {"duration": now, "channels": 1, "models": ["synthetic"]},
+        "results": {
+            "channels": [{
+                "alternatives": [{
+                    "transcript": " ".join(w["punctuated_word"] for w in out),
+                    "confidence": 0.9,
+                    "words": out,
+                }],
+            }],
+        },
+    }
+
+
+def recall_timeline(duration, names=("Alice", "Bob", "Carol", "Dave"), seed=0):
+    rng = random.Random(seed)
+    events = []
+    now = 0.0
+    while now < duration:
+        events.append({"name": rng.choice(names), "user_id": rng.randint(1, 1000), "timestamp": now})
+        now += rng.uniform(1, 40)
+    return events
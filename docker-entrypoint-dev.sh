@@ -1,5 +1,11 @@
 #!/bin/sh
 
 cd /app
-celery -A wudpecker_transcribe.celery_config worker --loglevel=DEBUG&
+# API and workers share one metrics directory, /metrics aggregates it
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/wudpecker-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+celery -A wudpecker_transcribe.celery_config worker -n io@%h -P gevent -c ${IO_CONCURRENCY:-100} -Q wudpecker-transcribe.provider,wudpecker-transcribe.results,wudpecker-transcribe.delivery --loglevel=DEBUG&
+celery -A wudpecker_transcribe.celery_config worker -n cpu@%h -P prefork -Q wudpecker-transcribe.postprocess --loglevel=DEBUG&
+python3 -m wudpecker_transcribe.azure_poller&
+python3 -m wudpecker_transcribe.callback_dispatcher&
 python3 run.py
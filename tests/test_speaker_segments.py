@@ -0,0 +1,71 @@
+import copy
+import random
+import unittest
+
+from wudpecker_transcribe.celery_config import speaker_segments
+from wudpecker_transcribe.speakers import speaker_name_map
+from wudpecker_transcribe.transcript_model import Transcript
+
+# The copy-free speaker annotation must produce exactly what the previous
+# deepcopy + linear scan speaker_segments did, on small seeded transcripts.
+
+
+def legacy_speaker_segments(transcript, speakers_mapping):
+    formatted = copy.deepcopy(transcript)
+    for segment in formatted["results"]["speaker_labels"]["segments"]:
+        speaker_label = segment.get("speaker_label")
+        speaker_info = next((s for s in speakers_mapping if s['label'] == speaker_label), None)
+        if speaker_info:
+            speaker_name = speaker_info.get("name", "Unknown")
+            if speaker_name == "Unknown":
+                speaker_name = f"Speaker {int(speaker_label.split('_')[-1])+1}"
+        else:
+            speaker_name = f"Speaker {int(speaker_label.split('_')[-1])+1}"
+        segment["speaker_name"] = speaker_name
+        for item in segment.get("items", []):
+            item.pop("speaker_name", None)
+    return formatted
+
+
+def deepgram_response(seed, words, speakers):
+    rng = random.Random(seed)
+    time = 0.0
+    speaker = 0
+    items = []
+    for i in range(words):
+        if rng.random() < 0.15:
+            speaker = rng.randrange(speakers)
+        start = time + rng.uniform(0, 0.3)
+        end = start + rng.uniform(0.05, 0.8)
+        time = end
+        items.append({"speaker": speaker, "start": start, "end": end, "punctuated_word": f"w{i}"})
+    text = " ".join(item["punctuated_word"] for item in items)
+    return {"results": {"channels": [{"alternatives": [{"transcript": text, "words": items}]}]}}
+
+
+MAPPINGS = [
+    [],
+    [{"label": "spk_0", "name": "Alice", "primary": "no"},
+     {"label": "spk_1", "name": "Unknown", "primary": "no"},
+     {"label": "spk_3", "name": "Carol", "primary": "no"}],
+    # first entry of a label wins, entries without a name are Unknown
+    [{"label": "spk_2", "name": "Bob"},
+     {"label": "spk_2", "name": "Dave"},
+     {"label": "spk_0"}],
+]
+
+
+class SpeakerSegmentsTest(unittest.TestCase):
+
+    def test_matches_legacy(self):
+        for seed in range(5):
+            transcript = Transcript.from_deepgram(deepgram_response(seed, words=300, speakers=1 + seed))
+            for mapping in MAPPINGS:
+                with self.subTest(seed=seed, mapping=mapping):
+                    expected = legacy_speaker_segments(transcript.to_wudpecker(), mapping)
+                    self.assertEqual(speaker_segments(transcript.to_wudpecker(), mapping), expected)
+                    self.assertEqual(transcript.to_wudpecker(speaker_name_map(mapping)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
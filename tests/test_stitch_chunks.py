@@ -0,0 +1,83 @@
+import random
+import unittest
+
+from wudpecker_transcribe.long_audio import plan_windows, stitch_chunks
+
+# A seeded recording is cut into overlapping windows the way long audio mode
+# does, every window transcribed with its own speaker labels and slightly
+# different timings in the overlap. Stitching must give back every word once
+# and keep a voice on one speaker label whenever it is heard in the overlaps.
+
+
+def recording(seed, words, speakers):
+    rng = random.Random(seed)
+    time = 0.0
+    speaker = 0
+    items = []
+    for i in range(words):
+        if rng.random() < 0.3:
+            speaker = rng.randrange(speakers)
+        start = time + rng.uniform(0, 0.3)
+        end = start + rng.uniform(0.05, 0.6)
+        time = end
+        items.append({"word": f"w{i}", "punctuated_word": f"w{i}", "speaker": speaker, "start": start, "end": end})
+    return items
+
+
+def transcribe_window(rng, items, start, end, speakers):
+    # what Deepgram returns for one window: relative times, own speaker labels
+    labels = list(range(speakers))
+    rng.shuffle(labels)
+    words = []
+    for item in items:
+        if item["start"] < start or item["end"] > end:
+            continue
+        jitter = rng.uniform(-0.05, 0.05)
+        words.append(dict(item, speaker=labels[item["speaker"]],
+                          start=max(item["start"] - start + jitter, 0), end=item["end"] - start + jitter))
+    return {"start": start, "end": end,
+            "response": {"results": {"channels": [{"alternatives": [{"words": words}]}]}}}
+
+
+class StitchChunksTest(unittest.TestCase):
+
+    def stitch(self, seed, speakers):
+        items = recording(seed, 800, speakers)
+        windows = plan_windows(items[-1]["end"], 120, 20)
+        self.assertGreater(len(windows), 2)
+        rng = random.Random(seed)
+        chunks = [transcribe_window(rng, items, start, end, speakers) for start, end in windows]
+        rng.shuffle(chunks)
+        return items, chunks, stitch_chunks(chunks)
+
+    def test_overlap_words_kept_once(self):
+        for seed in range(5):
+            items, chunks, stitched = self.stitch(seed, 3)
+            words = stitched["results"]["channels"][0]["alternatives"][0]["words"]
+            self.assertEqual([word["word"] for word in words], [item["word"] for item in items])
+            self.assertEqual(stitched["metadata"]["chunks"], len(chunks))
+
+    def test_speakers_reconciled_across_windows(self):
+        for seed in range(5):
+            for speakers in (2, 4):
+                items, chunks, stitched = self.stitch(seed, speakers)
+                words = stitched["results"]["channels"][0]["alternatives"][0]["words"]
+                labels = {}
+                voices = {}
+                for item, word in zip(items, words):
+                    labels.setdefault(item["speaker"], set()).add(word["speaker"])
+                    voices.setdefault(word["speaker"], set()).add(item["speaker"])
+                # two voices never share a label
+                self.assertTrue(all(len(heard) == 1 for heard in voices.values()))
+                # a voice heard in every overlap keeps one label, others can only be split
+                windows = sorted((chunk["start"], chunk["end"]) for chunk in chunks)
+                for speaker, stitched_labels in labels.items():
+                    linked = all(any(item["speaker"] == speaker and start <= item["start"] and item["end"] <= end
+                                     for item in items)
+                                 for (_, end), (start, _) in zip(windows, windows[1:]))
+                    if linked:
+                        self.assertEqual(len(stitched_labels), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+import math
+import os
+import threading
+import time
+
+import redis
+
+from wudpecker_transcribe import serialization
+from wudpecker_transcribe.redis_client import get_redis
+
+# Admission control for the API. The load is the number of messages waiting
+# in the broker queues plus the provider jobs running right now (tracked by
+# the workers in INFLIGHT_KEY). Above ADMISSION_MAX_LOAD new jobs get a 429
+# with Retry-After; bulk jobs already above ADMISSION_BULK_LOAD are parked in
+# a holding list (ADMISSION_HOLD, default on) and released into the broker
+# in order as the load drops. ADMISSION_MAX_LOAD=0 turns it all off.
+# A released job moves from the holding list into RELEASING_KEY until it is
+# published; jobs a crashed API process left there for longer than
+# ADMISSION_RELEASE_TIMEOUT go back to the head of the holding list, so a
+# held job is published at least once (twice if the crash came between
+# publishing and clearing it, under the same task id).
+
+INFLIGHT_KEY = "wudpecker:inflight:provider"
+HELD_KEY = "wudpecker:admission:held"
+RELEASING_KEY = "wudpecker:admission:releasing"
+# kombu's redis priority emulation, see broker_transport_options
+PRIORITY_STEPS = range(10)
+PRIORITY_SEP = ":"
+
+# pop up to ARGV[1] held jobs, remembering when they were taken
+CLAIM_HELD = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local jobs = {}
+for i = 1, tonumber(ARGV[1]) do
+    local job = redis.call('LPOP', KEYS[1])
+    if not job then break end
+    redis.call('ZADD', KEYS[2], now, job)
+    jobs[#jobs + 1] = job
+end
+return jobs
+"""
+
+# jobs taken longer than ARGV[1] seconds ago go back to the head, in order
+RECOVER_HELD = """
+local clock = redis.call('TIME')
+local cutoff = tonumber(clock[1]) + tonumber(clock[2]) / 1000000 - tonumber(ARGV[1])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', cutoff)
+for i = #stale, 1, -1 do
+    redis.call('LPUSH', KEYS[1], stale[i])
+    redis.call('ZREM', KEYS[2], stale[i])
+end
+return #stale
+"""
+
+ADMIT = "admit"
+HOLD = "hold"
+REJECT = "reject"
+
+
+def _env(name, default):
+    return float(os.getenv(name, default))
+
+
+def track_start(task_id):
+    try:
+        get_redis().zadd(INFLIGHT_KEY, {task_id: time.time()})
+    except redis.RedisError:
+        pass
+
+
+def track_end(task_id):
+    try:
+        get_redis().zrem(INFLIGHT_KEY, task_id)
+    except redis.RedisError:
+        pass
+
+
+class Admission:
+
+    def __init__(self, broker_url, queues):
+        self.broker_url = broker_url
+        self.queues = queues
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+        self._sampled_at = 0.0
+        self._state = None
+        self._scripts = None
+
+    def scripts(self):
+        if self._scripts is None:
+            client = get_redis()
+            self._scripts = (client.register_script(CLAIM_HELD), client.register_script(RECOVER_HELD))
+        return self._scripts
+
+    def max_load(self):
+        return _env("ADMISSION_MAX_LOAD", 0)
+
+    def bulk_load(self):
+        return _env("ADMISSION_BULK_LOAD", self.max_load() / 2)
+
+    def broker(self):
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = redis.Redis.from_url(self.broker_url)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def queue_keys(self):
+        return [queue if priority == 0 else f"{queue}{PRIORITY_SEP}{priority}"
+                for queue in self.queues for priority in PRIORITY_STEPS]
+
+    def sample(self):
+        now = time.time()
+        with self._lock:
+            if self._state is not None and now - self._sampled_at < _env("ADMISSION_SAMPLE_SECONDS", 1):
+                return self._state
+        with self.broker().pipeline(transaction=False) as pipe:
+            for key in self.queue_keys():
+                pipe.llen(key)
+            depth = sum(pipe.execute())
+        state_client = get_redis()
+        with state_client.pipeline(transaction=False) as pipe:
+            # entries of workers that died without cleaning up age out
+            pipe.zremrangebyscore(INFLIGHT_KEY, 0, now - _env("ADMISSION_INFLIGHT_MAX_AGE", 3 * 3600))
+            pipe.zcard(INFLIGHT_KEY)
+            pipe.llen(HELD_KEY)
+            _, inflight, held = pipe.execute()
+        with self._lock:
+            self._state = {"depth": depth, "inflight": inflight, "held": held}
+            self._sampled_at = now
+            return self._state
+
+    def load(self):
+        state = self.sample()
+        return state["depth"] + state["inflight"]
+
+    def decide(self, count, bulk=False):
+        if self.max_load() <= 0:
+            return ADMIT
+        try:
+            state = self.sample()
+        except redis.RedisError:
+            # without Redis there is nothing to measure, nor to enqueue into
+            return ADMIT
+        load = state["depth"] + state["inflight"]
+        if bulk and (state["held"] or load + count > self.bulk_load()):
+            # keep bulk jobs in order once some are held
+            decision = HOLD if os.getenv("ADMISSION_HOLD", "1").lower() not in ("0", "false", "no") else REJECT
+        elif load + count > self.max_load():
+            decision = REJECT
+        else:
+            decision = ADMIT
+        with self._lock:
+            # account for this request until the next sample
+            if decision == ADMIT:
+                state["depth"] += count
+            elif decision == HOLD:
+                state["held"] += count
+        return decision
+
+    def retry_after(self):
+        # longer the further over the limit we are
+        base = _env("ADMISSION_RETRY_AFTER", 10)
+        try:
+            ratio = self.load() / self.max_load()
+        except (redis.RedisError, ZeroDivisionError):
+            ratio = 1
+        return int(min(math.ceil(base * max(ratio, 1)), _env("ADMISSION_RETRY_AFTER_MAX", 300)))
+
+    def hold(self, jobs):
+        # jobs: dicts with task, args, task_id and priority
+        get_redis().rpush(HELD_KEY, *[serialization.dumps(job) for job in jobs])
+
+    def release_held(self, send_task):
+        # moves held jobs into the broker while the load is under the bulk limit
+        released = 0
+        client = get_redis()
+        claim, recover = self.scripts()
+        recover(keys=[HELD_KEY, RELEASING_KEY], args=[_env("ADMISSION_RELEASE_TIMEOUT", 60)], client=client)
+        while True:
+            with self._lock:
+                self._state = None
+            room = int(self.bulk_load() - self.load())
+            if room <= 0:
+                return released
+            batch = claim(keys=[HELD_KEY, RELEASING_KEY], args=[min(room, int(_env("ADMISSION_RELEASE_BATCH", 100)))],
+                          client=client)
+            if not batch:
+                return released
+            for i, raw in enumerate(batch):
+                job = serialization.loads(raw)
+                try:
+                    send_task(job["task"], args=job["args"], task_id=job["task_id"], priority=job["priority"])
+                except Exception:
+                    # put back what was not published, in order
+                    with client.pipeline() as pipe:
+                        pipe.zrem(RELEASING_KEY, *batch[i:])
+                        pipe.lpush(HELD_KEY, *reversed(batch[i:]))
+                        pipe.execute()
+                    raise
+                client.zrem(RELEASING_KEY, raw)
+                released += 1
@@ -0,0 +1,149 @@
+import mimetypes
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+from wudpecker_transcribe import storage
+
+# Audio sources Deepgram cannot (or should not) fetch by url are streamed to
+# it as a chunked request body: s3://bucket/key objects, local paths and,
+# with DEEPGRAM_AUDIO_UPLOAD=stream, https S3 urls, read with our own
+# credentials so private objects work. S3 objects are read with
+# AUDIO_STREAM_PREFETCH parallel ranged GETs of AUDIO_STREAM_CHUNK bytes, so
+# at most prefetch * chunk bytes are held in memory.
+# The url comes from the API request, so only buckets in
+# ALLOWED_AUDIO_BUCKETS (default BUCKET_NAME) and local files under
+# AUDIO_LOCAL_ROOT (unset: none) are read; any other url is left to Deepgram.
+
+
+def _env(name, default):
+    return int(os.getenv(name, default))
+
+
+def _s3_location(parsed):
+    # virtual hosted (bucket.s3.region.amazonaws.com/key) or path style
+    # (s3.region.amazonaws.com/bucket/key) S3 url
+    host = parsed.netloc.split(":")[0]
+    if not host.endswith(".amazonaws.com"):
+        return None
+    path = unquote(parsed.path).lstrip("/")
+    if host.startswith("s3.") or host.startswith("s3-"):
+        bucket, _, key = path.partition("/")
+    elif ".s3." in host or ".s3-" in host:
+        bucket, key = host.split(".s3", 1)[0], path
+    else:
+        return None
+    return (bucket, key) if bucket and key else None
+
+
+def allowed_buckets():
+    buckets = os.getenv("ALLOWED_AUDIO_BUCKETS") or os.getenv("BUCKET_NAME") or ""
+    return {bucket.strip() for bucket in buckets.split(",") if bucket.strip()}
+
+
+def local_path(path):
+    # the real path when it is inside AUDIO_LOCAL_ROOT, None otherwise
+    root = os.getenv("AUDIO_LOCAL_ROOT")
+    if not root or not path:
+        return None
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+
+def resolve(url):
+    # ("s3", (bucket, key)) or ("file", path) for sources to stream, None when
+    # Deepgram should fetch the url itself
+    parsed = urlparse(url)
+    location = None
+    if parsed.scheme == "s3":
+        location = (parsed.netloc, unquote(parsed.path).lstrip("/"))
+    elif parsed.scheme in ("", "file"):
+        path = local_path(unquote(parsed.path))
+        return ("file", path) if path is not None else None
+    elif os.getenv("DEEPGRAM_AUDIO_UPLOAD", "url") == "stream":
+        location = _s3_location(parsed)
+    if location is not None and location[0] in allowed_buckets() and location[1]:
+        return "s3", location
+    return None
+
+
+def content_type_for(name, stored=None):
+    # the stored S3 content type unless it is the generic default
+    if stored and stored not in ("binary/octet-stream", "application/octet-stream"):
+        return stored
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def file_chunks(path, chunk_size):
+    with open(path, "rb") as audio:
+        while True:
+            chunk = audio.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _read_range(bucket, key, start, end):
+    response = storage.get_s3().get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+    return response["Body"].read()
+
+
+def s3_ranged_chunks(bucket, key, size, chunk_size, prefetch):
+    ranges = iter([(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)])
+    with ThreadPoolExecutor(max_workers=prefetch) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_read_range, bucket, key, start, end))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            chunk = pending.popleft().result()
+            following = next(ranges, None)
+            if following is not None:
+                pending.append(pool.submit(_read_range, bucket, key, *following))
+            yield chunk
+
+
+def s3_body_chunks(body, chunk_size):
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+
+def open_stream(source):
+    # (iterable of byte chunks, content type)
+    kind, location = source
+    chunk_size = _env("AUDIO_STREAM_CHUNK", 8 * 1024 * 1024)
+    if kind == "file":
+        if not os.path.isfile(location):
+            raise FileNotFoundError(location)
+        return file_chunks(location, chunk_size), content_type_for(location)
+
+    bucket, key = location
+    prefetch = _env("AUDIO_STREAM_PREFETCH", 4)
+    if prefetch > 0:
+        head = storage.get_s3().head_object(Bucket=bucket, Key=key)
+        chunks = s3_ranged_chunks(bucket, key, head["ContentLength"], chunk_size, prefetch)
+        return chunks, content_type_for(key, head.get("ContentType"))
+    response = storage.get_s3().get_object(Bucket=bucket, Key=key)
+    return s3_body_chunks(response["Body"], chunk_size), content_type_for(key, response.get("ContentType"))
+
+
+def fingerprint(source):
+    # result cache identity of a streamed source, same shape as for urls
+    kind, location = source
+    try:
+        if kind == "file":
+            stat = os.stat(location)
+            return f"{location}|{stat.st_mtime_ns}|{stat.st_size}"
+        bucket, key = location
+        head = storage.get_s3().head_object(Bucket=bucket, Key=key)
+        return f"{head.get('VersionId') or head['ETag']}|{head['ContentLength']}"
+    except Exception:
+        return None
@@ -0,0 +1,172 @@
+import codecs
+import functools
+import json
+import re
+
+from wudpecker_transcribe.transcript_model import Transcript
+
+# HELPER functions to convert Azure batch transcription results into the
+# wudpecker format in a single pass.
+
+AZURE_STREAM_CHUNK = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+# Azure always writes durations as PT[#H][#M][#[.######]S]; anything else
+# (days, more than microsecond precision, ...) goes through isodate.
+_PT_RE = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)(?:\.(\d{1,6}))?S)?\Z')
+
+
+@functools.lru_cache(maxsize=65536)
+def PTtoSec(ptime):
+    match = _PT_RE.match(ptime)
+    if match is None or ptime == 'PT':
+        import isodate
+        return isodate.parse_duration(ptime).total_seconds()
+    hours, minutes, seconds, fraction = match.groups()
+    # same arithmetic as timedelta.total_seconds() so results are identical
+    micro = ((int(hours or 0) * 60 + int(minutes or 0)) * 60 + int(seconds or 0)) * 1000000
+    if fraction:
+        micro += int(fraction.ljust(6, '0'))
+    return micro / 1000000
+
+
+def word_times(words):
+    # (start, end) seconds for every word of a phrase
+    times = []
+    for word in words:
+        start = PTtoSec(word["offset"])
+        times.append((start, start + PTtoSec(word["duration"])))
+    return times
+
+
+class _JsonStream:
+    # Minimal pull reader over an iterable of byte chunks. Only the part of
+    # the document that has not been consumed yet is kept in memory.
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        wanted = max(len(self.buffer), 1)
+        read = 0
+        while read < wanted:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.buffer += self._utf8.decode(b'', final=True)
+                self.eof = True
+                break
+            text = chunk if isinstance(chunk, str) else self._utf8.decode(chunk)
+            self.buffer += text
+            read += len(text)
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of Azure transcript")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in Azure transcript at {self.buffer[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def members(self, streamed_keys):
+        # Yields (key, value) for every member of the top-level object. Arrays
+        # under streamed_keys are yielded one (key, element) at a time.
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key in streamed_keys and self.peek() == '[':
+                self.pos += 1
+                if self.peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.peek() == ',':
+                            self.pos += 1
+                            continue
+                        self.expect(']')
+                        break
+            else:
+                yield key, self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+
+def _add_phrase(transcript, phrase, label_map):
+    speaker = phrase["speaker"]
+    if speaker not in label_map:
+        label_map[speaker] = len(label_map)
+
+    offset = PTtoSec(phrase["offset"])
+    best = phrase["nBest"][0]
+    broken_phrase = best["display"].split()
+    broken_phrase_lex = best["lexical"].split()
+    if len(broken_phrase) != len(broken_phrase_lex):
+        broken_phrase = broken_phrase_lex
+    words = [(start, end, content) for content, (start, end) in zip(broken_phrase, word_times(best["words"]))]
+    # consecutive phrases of the same speaker become one segment
+    transcript.add_phrase(label_map[speaker], offset, offset + PTtoSec(phrase["duration"]), words)
+
+
+def _parse_members(members):
+    transcript = Transcript(None, status="AZURE")
+    label_map = {}
+    for key, value in members:
+        if key == "combinedRecognizedPhrases":
+            if value:
+                transcript.text = value[0]["display"]
+        elif key == "recognizedPhrases":
+            _add_phrase(transcript, value, label_map)
+    if transcript.text is None:
+        raise ValueError("Azure transcript has no combinedRecognizedPhrases")
+    transcript.speaker_count = len(label_map)
+    return transcript
+
+
+def parse_azure(data):
+    members = [("combinedRecognizedPhrases", data.get("combinedRecognizedPhrases"))]
+    members.extend(("recognizedPhrases", phrase) for phrase in data.get("recognizedPhrases", []))
+    return _parse_members(members)
+
+
+def parse_azure_stream(chunks):
+    return _parse_members(_JsonStream(chunks).members({"recognizedPhrases"}))
@@ -0,0 +1,55 @@
+import json
+import os
+import time
+
+import redis
+
+from wudpecker_transcribe.redis_client import get_redis
+
+# Outstanding Azure batch transcriptions, watched by azure_poller.
+# PENDING_KEY is a sorted set of transcription urls scored by the next time
+# they should be polled, STARTED_KEY remembers when each one was created.
+
+PENDING_KEY = "wudpecker:azure:pending"
+STARTED_KEY = "wudpecker:azure:started"
+CLAIM_PREFIX = "wudpecker:azure:claimed:"
+CLAIM_TTL = 7 * 24 * 3600
+
+
+def track_transcription(response_text):
+    # response_text is the body returned by the Azure create transcription call
+    try:
+        url = json.loads(response_text)["self"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    now = time.time()
+    first_poll = now + float(os.getenv("AZURE_POLL_MIN_INTERVAL", 15))
+    try:
+        pipe = get_redis().pipeline()
+        pipe.zadd(PENDING_KEY, {url: first_poll})
+        pipe.hset(STARTED_KEY, url, now)
+        pipe.execute()
+    except redis.RedisError as e:
+        # the /done webhook still picks the job up
+        print(f"Tracking Azure transcription {url} failed: {e}", flush=True)
+        return None
+    return url
+
+
+def untrack_transcription(url):
+    pipe = get_redis().pipeline()
+    pipe.zrem(PENDING_KEY, url)
+    pipe.hdel(STARTED_KEY, url)
+    pipe.execute()
+
+
+def claim_transcription(url):
+    # Both the /done webhook and the poller can hand the same finished
+    # transcription to get_transcript, only the first claim processes it.
+    claimed = get_redis().set(CLAIM_PREFIX + url, 1, nx=True, ex=CLAIM_TTL)
+    untrack_transcription(url)
+    return bool(claimed)
+
+
+def release_claim(url):
+    get_redis().delete(CLAIM_PREFIX + url)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from wudpecker_transcribe.azure_jobs import PENDING_KEY, STARTED_KEY
+from wudpecker_transcribe.celery_config import fail_logger, get_transcript
+from wudpecker_transcribe.redis_client import get_async_redis
+
+# Watches every outstanding Azure transcription and dispatches get_transcript
+# once Azure reports it finished, so a lost or delayed /done webhook does not
+# stall the job. Run with: python -m wudpecker_transcribe.azure_poller
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# how long a batch of due transcriptions is hidden from other pollers
+LEASE_SECONDS = 60
+
+
+def _env(name, default):
+    return float(os.getenv(name, default))
+
+
+async def run_sync(fn, *args):
+    # asyncio.to_thread is 3.9+, the image runs 3.8
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def next_interval(age):
+    # poll young jobs often and long-running ones less and less
+    return min(max(age / 10, _env("AZURE_POLL_MIN_INTERVAL", 15)), _env("AZURE_POLL_MAX_INTERVAL", 300))
+
+
+async def poll_one(session, redis, url, semaphore):
+    async with semaphore:
+        try:
+            async with session.get(url, headers={"Ocp-Apim-Subscription-Key": os.getenv("AZURE_KEY", "")}) as response:
+                if response.status == 404:
+                    await _untrack(redis, url)
+                    return
+                response.raise_for_status()
+                job = await response.json(content_type=None)
+        except Exception as e:
+            logger.warning("Polling %s failed: %s", url, e)
+            await redis.zadd(PENDING_KEY, {url: time.time() + _env("AZURE_POLL_MIN_INTERVAL", 15)}, xx=True)
+            return
+
+    status = job.get("status")
+    uuid = job.get("displayName")
+    if status == "Succeeded":
+        # zrem succeeds for exactly one poller
+        if await _untrack(redis, url):
+            await run_sync(get_transcript.delay, url)
+    elif status == "Failed":
+        if await _untrack(redis, url):
+            error = job.get("properties", {}).get("error", {})
+            await run_sync(fail_logger, uuid, f"azure transcription failed: {error}")
+    else:
+        started = await redis.hget(STARTED_KEY, url)
+        age = time.time() - float(started or time.time())
+        if age > _env("AZURE_POLL_MAX_AGE", 24 * 3600):
+            if await _untrack(redis, url):
+                await run_sync(fail_logger, uuid, f"azure transcription still {status} after {int(age)}s")
+            return
+        await redis.zadd(PENDING_KEY, {url: time.time() + next_interval(age)}, xx=True)
+
+
+async def _untrack(redis, url):
+    removed = await redis.zrem(PENDING_KEY, url)
+    await redis.hdel(STARTED_KEY, url)
+    return removed
+
+
+async def poll_forever():
+    redis = get_async_redis()
+    semaphore = asyncio.Semaphore(int(_env("AZURE_POLL_CONCURRENCY", 100)))
+    batch = int(_env("AZURE_POLL_BATCH", 500))
+    timeout = aiohttp.ClientTimeout(total=_env("HTTP_READ_TIMEOUT", 60))
+    connector = aiohttp.TCPConnector(limit=int(_env("AZURE_POLL_CONCURRENCY", 100)))
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        try:
+            while True:
+                now = time.time()
+                due = await redis.zrangebyscore(PENDING_KEY, 0, now, start=0, num=batch)
+                if not due:
+                    await asyncio.sleep(1)
+                    continue
+                due = [url.decode() for url in due]
+                await redis.zadd(PENDING_KEY, {url: now + LEASE_SECONDS for url in due}, xx=True)
+                await asyncio.gather(*(poll_one(session, redis, url, semaphore) for url in due))
+        finally:
+            await redis.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(poll_forever())
@@ -0,0 +1,82 @@
+import os
+import time
+
+from celery import Celery
+from celery.signals import before_task_publish
+from dotenv import load_dotenv
+
+from wudpecker_transcribe import metrics
+
+# The Celery app as the API sees it: broker, queues, routes and priorities,
+# but none of the task code. Publishing goes by task name so the API process
+# never imports celery_config and its provider/S3 dependencies; the workers
+# register the tasks on this same app by importing celery_config.
+
+load_dotenv()
+
+celery_app = Celery(
+    "wudpecker-transcribe",
+    broker=f"redis://{os.getenv('REDIS_URL')}:6379/3",
+    backend=f"redis://{os.getenv('REDIS_URL')}:6379/3",
+)
+
+# tasks are defined in celery_config and named after it
+TASK_PREFIX = "wudpecker_transcribe.celery_config."
+
+# Provider calls, Azure result fetching, post-processing and delivery (S3
+# upload, callbacks) each get their own queue so they can be served by
+# separately scaled workers: the network bound queues by a gevent pool with
+# high concurrency, post-processing (parsing, speaker matching) by prefork.
+PROVIDER_QUEUE = "wudpecker-transcribe.provider"
+RESULTS_QUEUE = "wudpecker-transcribe.results"
+POSTPROCESS_QUEUE = "wudpecker-transcribe.postprocess"
+DELIVERY_QUEUE = "wudpecker-transcribe.delivery"
+
+# Redis priorities are emulated by kombu with one list per step, 0 is
+# consumed first. Interactive (live meeting) jobs jump ahead of bulk backfills.
+INTERACTIVE_PRIORITY = 0
+DEFAULT_PRIORITY = 5
+BULK_PRIORITY = 9
+PRIORITIES = {"interactive": INTERACTIVE_PRIORITY, "default": DEFAULT_PRIORITY, "bulk": BULK_PRIORITY}
+
+TASK_QUEUES = {
+    "create_transcript": PROVIDER_QUEUE,
+    "create_transcript_manual": PROVIDER_QUEUE,
+    "deepgram_transcribe": PROVIDER_QUEUE,
+    "transcribe_chunk": PROVIDER_QUEUE,
+    "fetch_deepgram": PROVIDER_QUEUE,
+    "get_transcript": RESULTS_QUEUE,
+    "process_deepgram": POSTPROCESS_QUEUE,
+    "finish_chunked_transcript": POSTPROCESS_QUEUE,
+    "index_transcript": POSTPROCESS_QUEUE,
+    "upload_transcript": DELIVERY_QUEUE,
+    "notify_done": DELIVERY_QUEUE,
+}
+celery_app.conf.task_routes = {TASK_PREFIX + name: {"queue": queue} for name, queue in TASK_QUEUES.items()}
+# running provider jobs count towards the API's admission load
+PROVIDER_TASKS = frozenset(TASK_PREFIX + name for name, queue in TASK_QUEUES.items() if queue == PROVIDER_QUEUE)
+
+celery_app.conf.task_default_priority = DEFAULT_PRIORITY
+# chunks of a long recording keep the priority of the job that split them
+celery_app.conf.task_inherit_parent_priority = True
+celery_app.conf.broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+# a worker holding prefetched bulk messages would not see newer interactive ones
+celery_app.conf.worker_prefetch_multiplier = int(os.getenv("WORKER_PREFETCH_MULTIPLIER", 1))
+
+
+def priority_for(name):
+    return PRIORITIES.get(name, DEFAULT_PRIORITY)
+
+
+def signature(task, *args):
+    return celery_app.signature(TASK_PREFIX + task, args=args)
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    if headers is not None:
+        headers[metrics.PUBLISHED_AT_HEADER] = metrics.publish_time(headers, time.time())
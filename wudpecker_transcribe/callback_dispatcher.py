@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import aiohttp
+import redis
+from dotenv import load_dotenv
+
+from wudpecker_transcribe import metrics, serialization
+from wudpecker_transcribe.outbox import DEAD_KEY, DELAYED_KEY, GROUP, STREAM_KEY
+from wudpecker_transcribe.redis_client import get_async_redis
+
+# Delivers the callbacks queued in the outbox. Entries of a kind whose
+# receiver has a batch endpoint (<KIND>_CALLBACK_BATCH_URL, e.g.
+# DONE_CALLBACK_BATCH_URL) are posted together as one JSON list, everything
+# else is posted one by one, concurrently. Failed deliveries are retried with
+# exponential backoff and end up in the dead letter list after
+# CALLBACK_MAX_ATTEMPTS. Run with: python -m wudpecker_transcribe.callback_dispatcher
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def _env(name, default):
+    return float(os.getenv(name, default))
+
+
+def batch_url(kind):
+    return os.getenv(f"{kind.upper()}_CALLBACK_BATCH_URL")
+
+
+def backoff(attempts):
+    return min(_env("CALLBACK_RETRY_BASE", 5) * 2 ** attempts, _env("CALLBACK_RETRY_MAX", 600))
+
+
+def decode(fields):
+    entry = {key.decode(): value.decode() for key, value in fields.items()}
+    entry["attempts"] = int(entry.get("attempts", 0))
+    return entry
+
+
+def delivered(status):
+    # the receiver answered; only overload and server errors are worth a retry
+    return status < 500 and status != 429
+
+
+async def post(session, kind, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        async with session.post(url, **kwargs) as response:
+            await response.read()
+            ok = delivered(response.status)
+            if not ok:
+                logger.warning("%s callback to %s answered %s", kind, url, response.status)
+    except Exception as e:
+        logger.warning("%s callback to %s failed: %s", kind, url, e)
+        ok = False
+    metrics.CALLBACK_SECONDS.labels(kind).observe(time.perf_counter() - start)
+    metrics.CALLBACKS.labels(kind, "delivered" if ok else "failed").inc()
+    return ok
+
+
+async def deliver_one(session, entry, semaphore):
+    async with semaphore:
+        if entry["encoding"] == "json":
+            kwargs = {"data": entry["body"].encode(), "headers": {"Content-Type": "application/json"}}
+        elif entry["encoding"] == "form":
+            kwargs = {"data": serialization.loads(entry["body"])}
+        else:
+            # like requests with a str body: no Content-Type
+            kwargs = {"data": entry["body"].encode(), "skip_auto_headers": ["Content-Type"]}
+        return await post(session, entry["kind"], entry["url"], **kwargs)
+
+
+async def deliver_batch(session, kind, entries, semaphore):
+    body = serialization.dumps([serialization.loads(entry["body"]) for entry in entries])
+    async with semaphore:
+        return await post(session, kind, batch_url(kind), data=body, headers={"Content-Type": "application/json"})
+
+
+async def dispatch(redis_client, session, messages, semaphore):
+    # messages: [(stream id, entry)]
+    single = []
+    batches = {}
+    for message_id, entry in messages:
+        if entry["encoding"] != "raw" and batch_url(entry["kind"]):
+            batches.setdefault(entry["kind"], []).append((message_id, entry))
+        else:
+            single.append((message_id, entry))
+
+    async def run_single(message_id, entry):
+        return [(message_id, entry, await deliver_one(session, entry, semaphore))]
+
+    async def run_batch(kind, group):
+        ok = await deliver_batch(session, kind, [entry for _, entry in group], semaphore)
+        return [(message_id, entry, ok) for message_id, entry in group]
+
+    size = int(_env("CALLBACK_BATCH_SIZE", 100))
+    jobs = [run_single(message_id, entry) for message_id, entry in single]
+    for kind, group in batches.items():
+        jobs.extend(run_batch(kind, group[i:i + size]) for i in range(0, len(group), size))
+
+    done = []
+    for results in await asyncio.gather(*jobs):
+        for message_id, entry, ok in results:
+            if not ok:
+                await reschedule(redis_client, entry)
+            done.append(message_id)
+    if done:
+        # failures are already rescheduled, every handled message leaves the stream
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xack(STREAM_KEY, GROUP, *done)
+            pipe.xdel(STREAM_KEY, *done)
+            await pipe.execute()
+
+
+async def reschedule(redis_client, entry):
+    entry = dict(entry, attempts=entry["attempts"] + 1)
+    if entry["attempts"] >= _env("CALLBACK_MAX_ATTEMPTS", 10):
+        logger.error("Giving up on %s callback to %s after %s attempts", entry["kind"], entry["url"], entry["attempts"])
+        await redis_client.lpush(DEAD_KEY, serialization.dumps(entry))
+        return
+    await redis_client.zadd(DELAYED_KEY, {serialization.dumps(entry): time.time() + backoff(entry["attempts"])})
+
+
+async def promote_delayed(redis_client, batch):
+    due = await redis_client.zrangebyscore(DELAYED_KEY, 0, time.time(), start=0, num=batch)
+    for member in due:
+        # zrem succeeds for exactly one dispatcher
+        if await redis_client.zrem(DELAYED_KEY, member):
+            await redis_client.xadd(STREAM_KEY, serialization.loads(member))
+
+
+async def report_depth(redis_client):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.xlen(STREAM_KEY)
+        pipe.zcard(DELAYED_KEY)
+        pipe.llen(DEAD_KEY)
+        pending, delayed, dead = await pipe.execute()
+    metrics.OUTBOX_DEPTH.labels("pending").set(pending)
+    metrics.OUTBOX_DEPTH.labels("delayed").set(delayed)
+    metrics.OUTBOX_DEPTH.labels("dead").set(dead)
+
+
+async def dispatch_forever():
+    redis_client = get_async_redis()
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    batch = int(_env("CALLBACK_READ_BATCH", 500))
+    # entries a crashed dispatcher read but never acknowledged
+    claim_idle_ms = int(_env("CALLBACK_CLAIM_IDLE", 60) * 1000)
+    semaphore = asyncio.Semaphore(int(_env("CALLBACK_CONCURRENCY", 50)))
+    timeout = aiohttp.ClientTimeout(total=_env("HTTP_READ_TIMEOUT", 60))
+    connector = aiohttp.TCPConnector(limit=int(_env("CALLBACK_CONCURRENCY", 50)))
+    try:
+        await redis_client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        try:
+            reported = 0.0
+            while True:
+                await promote_delayed(redis_client, batch)
+                claimed = await redis_client.xautoclaim(STREAM_KEY, GROUP, consumer, claim_idle_ms, count=batch)
+                messages = claimed[1]
+                if not messages:
+                    read = await redis_client.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=batch, block=1000)
+                    messages = read[0][1] if read else []
+                messages = [(message_id, decode(fields)) for message_id, fields in messages if fields]
+                if messages:
+                    await dispatch(redis_client, session, messages, semaphore)
+                if time.monotonic() - reported > 5:
+                    await report_depth(redis_client)
+                    reported = time.monotonic()
+        finally:
+            await redis_client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(dispatch_forever())
@@ -1,35 +1,64 @@
-from celery import Celery
+from celery import chain, chord
+from celery.signals import task_postrun, task_prerun, worker_process_init, worker_process_shutdown
 import json
+import logging
 import os 
+import time
 from dotenv import load_dotenv
-import requests
-import boto3
-import isodate
-import copy
+import redis
+from concurrent.futures import ThreadPoolExecutor
+
+from wudpecker_transcribe import admission, audio_source, azure_jobs, credentials, dedup, http_client, long_audio, metrics, outbox, payloads, rate_limit, result_cache, search_index, serialization, storage, transcript_store
+from wudpecker_transcribe.azure import AZURE_STREAM_CHUNK, parse_azure_stream
+from wudpecker_transcribe.broker import PROVIDER_TASKS, celery_app
+from wudpecker_transcribe.languages import AZURE_CANDIDATE_LOCALES, AZURE_MULTI, AZURE_SINGLE, select_engine
+from wudpecker_transcribe.redis_client import get_redis
+from wudpecker_transcribe.speakers import RecallTimeline, match_speakers, speaker_name, speaker_name_map
+from wudpecker_transcribe.transcript_model import Transcript
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# provider endpoints, overridable to point at local stand-ins (benchmarks)
+AZURE_SPEECH_URL = 'https://northeurope.api.cognitive.microsoft.com'
+DEEPGRAM_API_URL = 'https://api.deepgram.com'
+RECALL_API_URL = 'https://api.recall.ai'
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    storage.init_s3()
 
-celery_app = Celery(
-    "wudpecker-transcribe",
-    broker=f"redis://{os.getenv('REDIS_URL')}:6379/3",
-    backend=f"redis://{os.getenv('REDIS_URL')}:6379/3",
-)
+@worker_process_shutdown.connect
+def shutdown_worker_process(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
 
-celery_app.conf.task_routes = {
-    "wudpecker-transcribe.tasks.*": {"queue": "wudpecker-transcribe_queue"},
-}
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    published_at = task.request.get(metrics.PUBLISHED_AT_HEADER)
+    if published_at is not None:
+        metrics.observe_queue_wait(task.name, published_at, time.time())
+
+@task_prerun.connect
+def track_provider_start(task_id=None, task=None, **kwargs):
+    if task.name in PROVIDER_TASKS:
+        admission.track_start(task_id)
+
+@task_postrun.connect
+def track_provider_end(task_id=None, task=None, **kwargs):
+    if task.name in PROVIDER_TASKS:
+        admission.track_end(task_id)
 
 def fail_logger(uuid,msg):
     callback = os.getenv('FAIL_CALLBACK')
-    response = requests.post(callback, json={
+    response = outbox.send("fail", callback, json={
         "status": "fail",
         "msg": msg,
         "uuid": uuid
     })
     return response
 
-def transcribe_azure_detect_language(url, uuid, langs):
+def transcribe_azure_detect_language(url, uuid, langs, route='CREATE'):
     azure_req_body = json.dumps(
         {'contentUrls': [url],
         'properties':
@@ -50,14 +79,17 @@ def transcribe_azure_detect_language(url, uuid, langs):
         'locale': langs[0],
         'displayName': uuid})
     azure_key = os.getenv('AZURE_KEY')
-    azure_request = requests.post('https://northeurope.api.cognitive.microsoft.com/speechtotext/v3.1/transcriptions', headers={
-                                'Content-Type': 'application/json', 'Ocp-Apim-Subscription-Key': azure_key}, data=azure_req_body)
+    rate_limit.acquire("azure", azure_key)
+    with metrics.PROVIDER_SECONDS.labels("azure", route).time():
+        azure_request = http_client.post(os.getenv('AZURE_SPEECH_URL', AZURE_SPEECH_URL) + '/speechtotext/v3.1/transcriptions', headers={
+                                    'Content-Type': 'application/json', 'Ocp-Apim-Subscription-Key': azure_key}, data=azure_req_body)
+    azure_jobs.track_transcription(azure_request.text)
     return azure_request.text
 
 
 
 
-def transcribe_azure_manual(url, uuid, lang):
+def transcribe_azure_manual(url, uuid, lang, route='CREATE_MANUAL'):
     azure_req_body = json.dumps(
         {'contentUrls': [url],
         'properties':
@@ -75,8 +107,11 @@ def transcribe_azure_manual(url, uuid, lang):
         'locale': lang,
         'displayName': uuid})
     azure_key = os.getenv('AZURE_KEY')
-    azure_request = requests.post('https://northeurope.api.cognitive.microsoft.com/speechtotext/v3.1/transcriptions', headers={
-                                'Content-Type': 'application/json', 'Ocp-Apim-Subscription-Key': azure_key}, data=azure_req_body)
+    rate_limit.acquire("azure", azure_key)
+    with metrics.PROVIDER_SECONDS.labels("azure", route).time():
+        azure_request = http_client.post(os.getenv('AZURE_SPEECH_URL', AZURE_SPEECH_URL) + '/speechtotext/v3.1/transcriptions', headers={
+                                    'Content-Type': 'application/json', 'Ocp-Apim-Subscription-Key': azure_key}, data=azure_req_body)
+    azure_jobs.track_transcription(azure_request.text)
     return azure_request.text
 
 
@@ -84,21 +119,11 @@ def transcribe_azure_manual(url, uuid, lang):
 def create_transcript(uuid, url):
     try:
         callback = os.getenv("CREATED_CALLBACK_URL")
-        langs = [
-                    "en-US",
-                    "da-DK",
-                    "fr-FR",
-                    "de-DE",
-                    "pt-BR",
-                    "ru-RU",
-                    "es-ES",
-                    "sv-SE",
-                ]
-
-        transcript = transcribe_azure_detect_language(url, uuid, langs)
-        response_request = requests.post(callback, data=transcript)
+        transcript = transcribe_azure_detect_language(url, uuid, list(AZURE_CANDIDATE_LOCALES))
+        response_request = outbox.send("created", callback, data=transcript)
         return transcript
     except Exception as e:
+        dedup.release_job(create_transcript.name, (uuid, url))
         fail_logger(uuid,f"create_transcript failed: {e}")
         raise
 
@@ -108,121 +133,222 @@ def create_transcript_manual(uuid, url, lang):
     try:
         callback = os.getenv("CREATED_CALLBACK_URL")
         transcript = transcribe_azure_manual(url, uuid, lang)
-        response_request = requests.post(callback, data=transcript)
+        response_request = outbox.send("created", callback, data=transcript)
         return transcript
     except Exception as e:
+        dedup.release_job(create_transcript_manual.name, (uuid, url, lang))
         fail_logger(uuid,f"create_transcript_manual failed: {e}")
         raise
 
-def lang_in_langs(lang, langs):
-    return (lang in langs or lang.split('-')[0] in langs)
-
 @celery_app.task
 def deepgram_transcribe(uuid, url, langs=[]):
     try:
-        DEEPGRAM_LANGS = ['da', 'nl', 'en', 'en-US', 'nl', 'fr', 'de', 'hi', 'it', 'ja', 'ko', 'no', 'pl', 'pt', 'pt-BR', 'pt-PT', 'es', 'es-419', 'ta', 'sv']
-        NOVA_LANGS = ['en-US','es','en']
-        nova = all(lang_in_langs(lang, NOVA_LANGS) for lang in langs)
-        callback = os.getenv("DONE_CALLBACK_URL")
-        if (len(langs) == 1 and lang_in_langs(langs[0],DEEPGRAM_LANGS)):
-            if langs[0] in DEEPGRAM_LANGS:
-                lang_code = langs[0]
-            else:
-                lang_code = langs[0].split('-')[0]
-
-            transcript = transcribe_deepgram(url, lang_code,nova=nova)
-            status = 'DEEPGRAM_SINGLE'
-        elif len(langs) == 1 and not lang_in_langs(langs[0],DEEPGRAM_LANGS):
-            res = transcribe_azure_manual(url, uuid, langs[0])
+        status, lang_code, nova = select_engine(langs)
+        if status == AZURE_SINGLE:
+            res = transcribe_azure_manual(url, uuid, langs[0], route=AZURE_SINGLE)
             if "self" not in res:
                 raise ValueError(f"Azure failed: {res}")
-            #print(res, flush=True)
-            status = 'AZURE_SINGLE'
             data = {"uuid": uuid, "status":status}
             return json.dumps(data)
-        elif (len(langs) > 1 and all(lang_in_langs(lang, DEEPGRAM_LANGS) for lang in langs)) or len(langs)==0:
-            transcript = transcribe_deepgram(url,nova=nova)
-            status = 'DEEPGRAM_MULTI'
-        else:
-            res = transcribe_azure_detect_language(url, uuid, langs)
+        if status == AZURE_MULTI:
+            res = transcribe_azure_detect_language(url, uuid, langs, route=AZURE_MULTI)
             if "self" not in res:
                 raise ValueError(f"Azure failed: {res}")
-            #print(res,flush=True)
-            status = 'AZURE_MULTI'
             data = {"uuid": uuid, "status":status}
             return json.dumps(data)
 
-        try:
-            # Extract the actual transcript text and words list
-            actual_transcript = transcript['results']['channels'][0]['alternatives'][0]['transcript']
-            words_list = transcript['results']['channels'][0]['alternatives'][0]['words']
-
-            # Check if transcript is empty or just whitespace, and if words list is empty
-            if not actual_transcript.strip() or not words_list:
-                data = {"uuid": uuid, "status": "EMPTY"}
-                requests.post(callback, data=data)
-                return json.dumps(data)
+        windows = long_audio.windows_for(url)
+        if windows:
+            chunks = [transcribe_chunk.s(uuid, url, start, end, lang_code, nova, langs, status) for start, end in windows]
+            chord(chunks)(
+                finish_chunked_transcript.s(uuid, url, langs, status)
+                | upload_transcript.s(url, langs)
+                | notify_done.s(url, langs)
+            )
+            return json.dumps({"uuid": uuid, "status": status, "chunks": len(windows)})
+
+        chain(
+            fetch_deepgram.s(uuid, url, lang_code, nova, langs, status),
+            process_deepgram.s(uuid, url, langs, status),
+            upload_transcript.s(url, langs),
+            notify_done.s(url, langs),
+        ).apply_async()
+        return json.dumps({"uuid": uuid, "status": status})
+    except Exception as e:
+        dedup.release_job(deepgram_transcribe.name, (uuid, url, langs))
+        fail_logger(uuid,f"deepgram failed: {e}")
+        raise
+
+# The Deepgram pipeline: fetch_deepgram -> process_deepgram -> upload_transcript
+# -> notify_done. Network stages retry on their own so a failed upload or
+# callback does not pay for the transcription again; documents are handed
+# over as payload references instead of through the broker.
+
+def retry_stage(task, exc, uuid, url, langs, stage):
+    # returns when out of retries, the caller re-raises
+    if task.request.retries >= task.max_retries:
+        dedup.release_job(deepgram_transcribe.name, (uuid, url, langs))
+        fail_logger(uuid, f"{stage} failed: {exc}")
+        return
+    raise task.retry(exc=exc, countdown=5 * 2 ** task.request.retries)
+
+@celery_app.task(bind=True, max_retries=3)
+def fetch_deepgram(self, uuid, url, lang=None, nova=False, langs=(), status=None):
+    try:
+        # warms the Recall cache for process_deepgram while Deepgram works
+        prefetch_recall(uuid)
+        transcript = transcribe_deepgram_cached(url, lang, nova=nova, route=status)
+        return payloads.put(transcript)
+    except Exception as e:
+        retry_stage(self, e, uuid, url, langs, "deepgram")
+        raise
+
+@celery_app.task
+def process_deepgram(ref, uuid, url, langs, status):
+    try:
+        result = build_transcript(uuid, url, payloads.get(ref), status)
+        payloads.delete(ref)
+        return result
+    except Exception as e:
+        dedup.release_job(deepgram_transcribe.name, (uuid, url, langs))
+        fail_logger(uuid,f"deepgram failed: {e}")
+        raise
+
+@celery_app.task(bind=True, max_retries=3)
+def upload_transcript(self, result, url, langs):
+    try:
+        if result["ref"]:
+            formatted = payloads.get(result["ref"])
+            storage.upload_json(result["uuid"] + '_final_.json', formatted)
+            if transcript_store.enabled():
+                transcript_store.write(result["uuid"], formatted)
+            if search_index.enabled():
+                # index_transcript deletes the payload once indexed
+                schedule_indexing(result["uuid"], ref=result["ref"])
             else:
-                formatted = parse_deepgram(transcript)
-        except Exception as e:
-            #print(transcript, flush=True)
-            failed_callback = os.getenv("FAILED_CALLBACK_URL")
-            response_request = requests.post(failed_callback, data={"uuid": uuid, "status": "failed", "url": url})
-            raise ValueError(f'Deepgram failed: {transcript}')
-
-        speakers = get_matched_speakers(uuid, formatted)
-        formatted = speaker_segments(formatted, speakers)
-        #formatted['results']["speakers"] = speakers
-        json_file_name = uuid + '_final_.json'
-
-        res = boto3.resource("s3", endpoint_url='https://s3.eu-central-1.amazonaws.com')
-        s3object = res.Object(os.getenv("BUCKET_NAME"), json_file_name)
-        s3object.put(Body=(bytes(json.dumps(formatted).encode('UTF-8'))))
-
-        # # Check if the meeting is coherent using coherency api
-        # try:
-        #     coherent_res = requests.get(f"{os.getenv('COHERENCY_URL')}/?azure={uuid}")
-        #     if not coherent_res.json():
-        #         transcribe_azure_detect_language(url, uuid)
-        #         return json.dumps({"uuid": uuid, "status":"Incoherent"})
-        # except Exception as e:
-        #     print(f"Coherency check failed: {str(e)}")
-
-        data = {"uuid": uuid, "status":status}
-        response_request = requests.post(callback, data=data)
+                payloads.delete(result["ref"])
+        return {"uuid": result["uuid"], "status": result["status"]}
+    except Exception as e:
+        retry_stage(self, e, result["uuid"], url, langs, "upload")
+        raise
+
+@celery_app.task(bind=True, max_retries=5)
+def notify_done(self, data, url, langs):
+    try:
+        outbox.send("done", os.getenv("DONE_CALLBACK_URL"), data=data)
         return json.dumps(data)
     except Exception as e:
+        retry_stage(self, e, data["uuid"], url, langs, "done callback")
+        raise
+
+def schedule_indexing(uuid, ref=None, formatted=None):
+    # search indexing is best effort, it never fails the transcript
+    try:
+        if ref is None:
+            ref = payloads.put(formatted)
+        index_transcript.delay(uuid, ref)
+    except Exception as e:
+        logger.warning("Could not schedule indexing of %s: %s", uuid, e)
+        if ref is not None:
+            payloads.delete(ref)
+
+@celery_app.task(bind=True, max_retries=3)
+def index_transcript(self, uuid, ref):
+    # owns ref: deleted once indexed or given up on, kept only for a retry
+    retrying = False
+    try:
+        search_index.index_transcript(uuid, payloads.get(ref))
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            logger.warning("Indexing %s failed: %s", uuid, e)
+            return
+        retrying = True
+        raise self.retry(exc=e, countdown=5 * 2 ** self.request.retries)
+    finally:
+        if not retrying:
+            payloads.delete(ref)
+
+@celery_app.task(bind=True, max_retries=3)
+def transcribe_chunk(self, uuid, url, start, end, lang=None, nova=False, langs=(), status=None):
+    # one window of a long recording, retried on its own
+    try:
+        audio = long_audio.extract_chunk(url, start, end)
+        response = transcribe_deepgram_audio(audio, 'audio/flac', lang, nova=nova, route=status)
+        if 'results' not in response:
+            raise ValueError(f"Deepgram failed: {response}")
+        return {"start": start, "end": end, "ref": payloads.put(response)}
+    except Exception as e:
+        retry_stage(self, e, uuid, url, langs, f"deepgram chunk {start}-{end}")
+        raise
+
+@celery_app.task
+def finish_chunked_transcript(chunks, uuid, url, langs, status):
+    try:
+        recall_future = prefetch_recall(uuid)
+        refs = [chunk["ref"] for chunk in chunks]
+        chunks = [{"start": chunk["start"], "end": chunk["end"], "response": payloads.get(chunk["ref"])} for chunk in chunks]
+        transcript = long_audio.stitch_chunks(chunks)
+        result = build_transcript(uuid, url, transcript, status, recall_future)
+        for ref in refs:
+            payloads.delete(ref)
+        return result
+    except Exception as e:
+        dedup.release_job(deepgram_transcribe.name, (uuid, url, langs))
         fail_logger(uuid,f"deepgram failed: {e}")
         raise
 
+def build_transcript(uuid, url, transcript, status, recall_future=None):
+    # parse and speaker match a Deepgram response, the formatted transcript
+    # is stashed for upload_transcript
+    try:
+        # Extract the actual transcript text and words list
+        actual_transcript = transcript['results']['channels'][0]['alternatives'][0]['transcript']
+        words_list = transcript['results']['channels'][0]['alternatives'][0]['words']
+
+        # Check if transcript is empty or just whitespace, and if words list is empty
+        if not actual_transcript.strip() or not words_list:
+            return {"uuid": uuid, "status": "EMPTY", "ref": None}
+        else:
+            with metrics.PARSE_SECONDS.labels("deepgram").time():
+                parsed = Transcript.from_deepgram(transcript)
+            metrics.TRANSCRIPT_WORDS.labels("deepgram").observe(parsed.word_count)
+    except Exception as e:
+        #print(transcript, flush=True)
+        failed_callback = os.getenv("FAILED_CALLBACK_URL")
+        response_request = outbox.send("failed", failed_callback, data={"uuid": uuid, "status": "failed", "url": url})
+        raise ValueError(f'Deepgram failed: {transcript}')
+
+    speakers = get_matched_speakers(uuid, parsed, recall_future)
+    formatted = parsed.to_wudpecker(speaker_name_map(speakers))
+    #formatted['results']["speakers"] = speakers
+
+    # # Check if the meeting is coherent using coherency api
+    # try:
+    #     coherent_res = requests.get(f"{os.getenv('COHERENCY_URL')}/?azure={uuid}")
+    #     if not coherent_res.json():
+    #         transcribe_azure_detect_language(url, uuid)
+    #         return json.dumps({"uuid": uuid, "status":"Incoherent"})
+    # except Exception as e:
+    #     print(f"Coherency check failed: {str(e)}")
+
+    return {"uuid": uuid, "status": status, "ref": payloads.put(formatted)}
+
 def speaker_segments(transcript, speakers_mapping):
-    formatted = copy.deepcopy(transcript)
-    results = formatted.get("results", {})
+    # annotates the segments of an already formatted transcript in place
+    results = transcript.get("results", {})
     transcripts = results.get("transcripts", [])
     speaker_labels = results.get("speaker_labels", {})
 
     if not transcripts or not speaker_labels:
-        return formatted
-
-    segments = speaker_labels.get("segments", [])
-
-    for segment in segments:
-        speaker_label = segment.get("speaker_label")
-        
-        # Find the speaker information in the mapping list
-        speaker_info = next((s for s in speakers_mapping if s['label'] == speaker_label), None)
-        if speaker_info:
-            speaker_name = speaker_info.get("name", f"Unknown")
-            if speaker_name == "Unknown":
-                speaker_name = f"Speaker {int(speaker_label.split('_')[-1])+1}"
-        else:
-            speaker_name = f"Speaker {int(speaker_label.split('_')[-1])+1}"
+        return transcript
 
-        segment["speaker_name"] = speaker_name
+    names = speaker_name_map(speakers_mapping)
+    for segment in speaker_labels.get("segments", []):
+        segment["speaker_name"] = speaker_name(segment.get("speaker_label"), names)
         for item in segment.get("items", []):
             item.pop("speaker_name", None)
 
-    return formatted
+    return transcript
 
 @celery_app.task
 def get_transcript(url):
@@ -230,155 +356,110 @@ def get_transcript(url):
         callback = os.getenv("DONE_CALLBACK_URL")
         failed_callback = os.getenv("FAILED_CALLBACK_URL")
         headers = {"Ocp-Apim-Subscription-Key": os.getenv('AZURE_KEY')}
+        claimed = False
 
-        get_request = requests.get(url, headers=headers)
-        req_obj = json.loads(get_request.text)
+        get_request = http_client.get(url, headers=headers)
+        req_obj = serialization.loads(get_request.content)
         files_url = req_obj["links"]["files"]
-        files_req = requests.get(files_url, headers=headers)
-        files_obj = json.loads(files_req.text)
+        files_req = http_client.get(files_url, headers=headers)
+        files_obj = serialization.loads(files_req.content)
         status = "Running"
         for file in files_obj["values"]:
             if file.get('kind', 'NaN') == "Transcription":
+                if not claimed:
+                    if not azure_jobs.claim_transcription(url):
+                        return json.dumps({"uuid": req_obj['displayName'], "status": "Duplicate"})
+                    claimed = True
                 status = "Complete"
                 json_url = file["links"]["contentUrl"]
-                json_download = requests.get(json_url, headers={'Content-Type': 'application/json'})
-                azure_transcript = json.loads(json_download.text)
+                json_download = http_client.get(json_url, headers={'Content-Type': 'application/json'}, stream=True)
 
                 # parse Transcript
+                recall_future = prefetch_recall(req_obj['displayName'])
                 try:
-                    parsed = make_speaker_matcher(combine_multiple_segments(ParseAzure(azure_transcript)))
-                    speakers = get_matched_speakers(req_obj['displayName'], parsed)
-                    parsed = speaker_segments(parsed, speakers)
+                    with json_download:
+                        # includes the download, the document is parsed while it streams in
+                        with metrics.PARSE_SECONDS.labels("azure").time():
+                            parsed = parse_azure_stream(json_download.iter_content(chunk_size=AZURE_STREAM_CHUNK))
+                    metrics.TRANSCRIPT_WORDS.labels("azure").observe(parsed.word_count)
+                    speakers = get_matched_speakers(req_obj['displayName'], parsed, recall_future)
+                    parsed = parsed.to_wudpecker(speaker_name_map(speakers))
                 except Exception as e:
                     data = {"uuid": req_obj['displayName'], "status": "EMPTY"}
-                    requests.post(callback, data=data)
+                    outbox.send("done", callback, data=data)
                     return json.dumps(data)
 
                 # when there are multiple owners in the same call, update the transcript for each
         
                 json_file_name = req_obj['displayName'] + '_final_.json'
-                res = boto3.resource("s3", endpoint_url='https://s3.eu-central-1.amazonaws.com')
-                s3object = res.Object(os.getenv("BUCKET_NAME"), json_file_name)
-                s3object.put(Body=(bytes(json.dumps(parsed).encode('UTF-8'))))
+                storage.upload_json(json_file_name, parsed)
+                if transcript_store.enabled():
+                    transcript_store.write(req_obj['displayName'], parsed)
+                if search_index.enabled():
+                    schedule_indexing(req_obj['displayName'], formatted=parsed)
         data = {"uuid": req_obj['displayName'], "status":status}
         if status == "Complete":
-            response_request = requests.post(callback, data=data)
+            response_request = outbox.send("done", callback, data=data)
         #print(json.dumps(data))
         return json.dumps(data)
     except Exception as e:
+        if claimed:
+            azure_jobs.release_claim(url)
         fail_logger(req_obj['displayName'],f"get_transcript failed: {e}")
         raise
 
 # HELPER functions to convert Azure format into Stupid wudpecker format
+RECALL_CACHE_PREFIX = "wudpecker:recall:"
+
+_prefetch_pool = None
+_prefetch_pid = None
+
+def prefetch_recall(uuid):
+    # start the Recall fetch now, it runs while the provider call is in flight
+    global _prefetch_pool, _prefetch_pid
+    if _prefetch_pool is None or _prefetch_pid != os.getpid():
+        _prefetch_pool = ThreadPoolExecutor(max_workers=4)
+        _prefetch_pid = os.getpid()
+    return _prefetch_pool.submit(get_recall, uuid)
+
 def get_recall(uuid):
-    token = "5832f6593b0b2062bdb90ed84c858756ceab9e13"
+    cache_key = RECALL_CACHE_PREFIX + uuid
+    try:
+        cached = get_redis().get(cache_key)
+        if cached is not None:
+            return serialization.loads(cached)
+    except redis.RedisError:
+        cached = None
+
+    token = os.getenv("RECALL_TOKEN")
+    if not token:
+        raise RuntimeError("RECALL_TOKEN is not set")
 
-    url = f"https://api.recall.ai/api/v1/bot/{uuid}/speaker_timeline/"
+    url = f"{os.getenv('RECALL_API_URL', RECALL_API_URL)}/api/v1/bot/{uuid}/speaker_timeline/"
     headers = {
         "accept": "application/json",
         "Authorization": "token "+token,
     }
-    response = requests.get(url, headers=headers)
-    data = json.loads(response.text)
+    response = http_client.get(url, headers=headers)
+    data = serialization.loads(response.content)
+    if response.ok and isinstance(data, list) and data:
+        try:
+            get_redis().set(cache_key, response.content, ex=int(os.getenv("RECALL_CACHE_TTL", 24 * 3600)))
+        except redis.RedisError:
+            pass
     return data
 
-def get_matched_speakers(uuid, transcript):
+def get_matched_speakers(uuid, transcript, recall_future=None):
     try:
-        azure = copy.deepcopy(transcript)
-        recall = get_recall(uuid)
-
-        #clean up
-        azure = azure["results"]["speaker_labels"]["segments"]
-        r = []
-        for segment in azure:
-            del segment["items"]
-            segment["start_time"] = int(float(segment["start_time"]))
-            segment["end_time"] = int(float(segment["end_time"]))
-            r.append(segment)
-        azure = r
-        
-        rec =[]
-        for segment in recall:
-            p = {
-                "start_time": int(segment["timestamp"]),
-                "speaker_name": segment["name"], 
-                "user_id": segment["user_id"]
-            }
-            rec.append(p)
-        recall = rec
-
-        speakers = list(set(d['speaker_label'] for d in azure))
-        
-        speakers.sort()
-        
-        test_segments = []
-        
-        for speaker in speakers:
-            count = 0
-            test_bunch = []
-            all_segs_of_speaker = [x for x in azure if x["speaker_label"] == speaker]
-            for seg in all_segs_of_speaker:
-                delta = seg["end_time"] - seg["start_time"]
-                if delta > 10:
-                    test_bunch.append(seg)
-                    count += 1
-                if count > 10:
-                    break
-                
-            test_segments.append(test_bunch)
-        
-        
-        
-        for speaker in test_segments:
-            for seg in speaker:
-                try:
-                    azure_start = seg["start_time"]
-                    # FIND THE AZURE START IN RECALL
-                    for recall_seg in recall:
-                        recall_start = recall_seg["start_time"]
-                        if azure_start - 4 <= recall_start <= azure_start + 4:
-                            seg["speaker_name"] = recall_seg["speaker_name"]
-                    if "speaker_name" not in seg:
-                        seg["speaker_name"] = "Unknown"
-                except:
-                    pass
-        
-        weights = []
-        for speaker in test_segments:
-            weight = {}
-            for test in speaker:
-                if test["speaker_name"] not in weight:
-                    weight[test["speaker_name"]] = 1
-                else:
-                    weight[test["speaker_name"]] += 1
-            weights.append(weight)
-        
-        result = []
-        
-        for weight in weights:
-            if weight:
-                winner = max(weight, key=lambda k: weight[k])
-                result.append(winner)
-            
-            
-        final_result = []
-
-        for i, res in enumerate(result):
-            spk_label = 'spk_' + str(i)
-            name = res
-            result_obj = {
-                "label": spk_label, "name": name, "primary": "no"
-            }
-            final_result.append(result_obj)
-
-
-        return final_result
-    except:
+        recall = recall_future.result() if recall_future is not None else get_recall(uuid)
+        with metrics.MATCH_SECONDS.time():
+            timeline = RecallTimeline(recall)
+            return match_speakers(transcript.speaker_spans(), timeline)
+    except Exception as e:
+        # the transcript goes out with generic speaker names
+        logger.warning("Speaker matching for %s failed: %r", uuid, e)
         return []
 
-def PTtoSec(ptime):
-    return isodate.parse_duration(ptime).total_seconds()
-
 def MergePunctuations(jdata):
     for index, word in enumerate(jdata["results"]["items"]):
         if index+1 < len(jdata["results"]["items"]):
@@ -407,165 +488,51 @@ def getWordFromTime(time, jdata):
     return found["alternatives"][0]["content"]
 
 
-def combine_multiple_segments(json_obj):
-    segments = []
-    previous = {}
-    c = 0
-    for current in json_obj['results']['speaker_labels']['segments']:
-        c += 1
-        if previous and current['speaker_label'] == previous['speaker_label'] and c != len(json_obj['results']['speaker_labels']['segments']):
-            previous['items'].extend(current['items'])
-            previous['end_time'] = current['end_time']
-        else:
-            segments.append(previous)
-            previous = current
-    segments.append(previous)
-    segments.pop(0)
-    json_obj['results']['speaker_labels']['segments'] = segments
-    return json_obj
-
-def rematch_speakers(aws_speaker, matching):
-    for speaker in matching:
-        if speaker[0] == aws_speaker:
-            return speaker[1]
-    return 'spk_100'
-
-
-def make_speaker_matcher(full_file):
-    speakers = []
-    match = []
-    for segment in full_file["results"]["speaker_labels"]["segments"]:
-        if segment['speaker_label'] not in speakers:
-            speakers.append(segment['speaker_label'])
-
-    i = 0
-    for speaker in speakers:
-        match.append((speaker, 'spk_' + str(i)))
-        i += 1
-    matched_speakers = match
-    for segment in full_file["results"]["speaker_labels"]["segments"]:
-        segment['speaker_label'] = rematch_speakers(
-            segment['speaker_label'], matched_speakers)
-        for word in segment['items']:
-            word['speaker_label'] = rematch_speakers(
-                word['speaker_label'], matched_speakers)
-    return full_file
-
-
-def ParseAzure(data):
-
-    transcript = {}
-    transcript["results"] = {}
-    transcript["status"] = "AZURE"
-
-    transcript["results"]["transcripts"] = []
-    transcript["results"]["transcripts"].append(
-        {"transcript": data["combinedRecognizedPhrases"][0]["display"]})
-
-    transcript["results"]["speaker_labels"] = {}
-    num_of_speakers = 0
-    all_speakers = []
-
-    for phrase in data["recognizedPhrases"]:
-        speaker_found = 0
-        for speaker in all_speakers:
-            if speaker == phrase["speaker"]:
-                speaker_found = 1
-
-        if speaker_found == 0:
-            all_speakers.append(phrase["speaker"])
-
-    num_of_speakers = len(all_speakers)
-
-    transcript["results"]["speaker_labels"]["speakers"] = num_of_speakers
-
-    transcript["results"]["speaker_labels"]["segments"] = []
-
-    for phrase in data["recognizedPhrases"]:
-        phrase_obj = {}
-        phrase_obj["start_time"] = str(PTtoSec(phrase["offset"]))
-        phrase_obj["end_time"] = str(
-            PTtoSec(phrase["offset"]) + PTtoSec(phrase["duration"]))
-        phrase_obj["speaker_label"] = "spk_" + str(phrase["speaker"] - 1)
-        phrase_obj["items"] = []
-        broken_phrase = phrase["nBest"][0]["display"].split()
-        broken_phrase_lex = phrase["nBest"][0]["lexical"].split()
-        if len(broken_phrase) != len(broken_phrase_lex):
-            broken_phrase = broken_phrase_lex
-        for idx, word in enumerate(phrase["nBest"][0]["words"]):
-            word_obj = {}
-            word_obj["start_time"] = str(PTtoSec(word["offset"]))
-            word_obj["speaker_label"] = "spk_" + str(phrase["speaker"] - 1)
-            word_obj["end_time"] = str(
-                PTtoSec(word["offset"]) + PTtoSec(word["duration"]))
-
-            if (idx < len(broken_phrase)):
-                word_obj["content"] = broken_phrase[idx]
-                phrase_obj["items"].append(word_obj)
-
-        transcript["results"]["speaker_labels"]["segments"].append(phrase_obj)
+def deepgram_model(nova):
+    return "nova" if nova else "general-enhanced"
+
+def transcribe_deepgram_cached(s3url, lang=None, nova=False, route=None):
+    key = result_cache.cache_key(s3url, "deepgram", deepgram_model(nova), lang)
+    if key:
+        cached = result_cache.load(key)
+        if cached is not None:
+            return cached
+    transcript = transcribe_deepgram(s3url, lang, nova=nova, route=route)
+    try:
+        usable = bool(transcript['results']['channels'][0]['alternatives'][0]['words'])
+    except (KeyError, IndexError, TypeError):
+        usable = False
+    if key and usable:
+        result_cache.store(key, transcript)
     return transcript
 
-def transcribe_deepgram(s3url, lang=None, nova=False):
-    res = requests.get(os.getenv("DEEPGRAM_TOKEN"))
-    token = json.loads(res.text)
-    deepgram_key = "Token "+token
-    if nova:
-        deepgram_key = "Token "+os.getenv("PROD_DEEPGRAM")
-    model = "nova" if nova else "general-enhanced"
+def deepgram_listen(body, content_type, lang=None, nova=False, route=None):
+    # the shared token service is only asked when the job does not use nova
+    deepgram_key = "Token " + (os.getenv("PROD_DEEPGRAM") if nova else credentials.deepgram_token())
+    rate_limit.acquire("deepgram", "prod" if nova else "shared")
+    model = deepgram_model(nova)
+    base = os.getenv("DEEPGRAM_API_URL", DEEPGRAM_API_URL)
     if lang:
-        url = f"https://api.deepgram.com/v1/listen?language={lang}&diarize=true&punctuate=true&utterances=true&numerals=true&model={model}&keywords=Wudpecker:1"
+        url = f"{base}/v1/listen?language={lang}&diarize=true&punctuate=true&utterances=true&numerals=true&model={model}&keywords=Wudpecker:1"
     else:
-        url = f"https://api.deepgram.com/v1/listen?detect_language=true&diarize=true&punctuate=true&utterances=true&numerals=true&model={model}&keywords=Wudpecker:1"
-    deepgram_request_data = json.dumps(
-        {'url': s3url})
-    deepgram_request = requests.post(url, headers={'Content-Type': 'application/json', 'Authorization': deepgram_key}, data=deepgram_request_data)
-    
-    return json.loads(deepgram_request.text)
+        url = f"{base}/v1/listen?detect_language=true&diarize=true&punctuate=true&utterances=true&numerals=true&model={model}&keywords=Wudpecker:1"
+    with metrics.PROVIDER_SECONDS.labels("deepgram", route or "DEEPGRAM").time():
+        deepgram_request = http_client.post(url, headers={'Content-Type': content_type, 'Authorization': deepgram_key}, data=body,
+                                            timeout=http_client.timeout(read=float(os.getenv("DEEPGRAM_READ_TIMEOUT", 600))))
+
+    return serialization.loads(deepgram_request.content)
+
+def transcribe_deepgram(s3url, lang=None, nova=False, route=None):
+    source = audio_source.resolve(s3url)
+    if source is None:
+        # Deepgram fetches the audio itself
+        return deepgram_listen(serialization.dumps({'url': s3url}), 'application/json', lang, nova=nova, route=route)
+    chunks, content_type = audio_source.open_stream(source)
+    return deepgram_listen(chunks, content_type, lang, nova=nova, route=route)
+
+def transcribe_deepgram_audio(audio, content_type, lang=None, nova=False, route=None):
+    return deepgram_listen(audio, content_type, lang, nova=nova, route=route)
 
 
 def parse_deepgram(data):
-    raw = data
-    new = {"results": { "transcripts": [{"transcript":raw["results"]["channels"][0]["alternatives"][0]["transcript"]}]}}
-    speakers = []
-    prev_speaker = -1
-    tmp_items = []
-    segments = []
-    for word in raw["results"]["channels"][0]["alternatives"][0]["words"]:
-        speaker = word["speaker"]
-        if speaker not in speakers:
-            speakers.append(speaker)
-        if prev_speaker != speaker:
-            if tmp_items:
-                tmp = {
-                    "start_time": tmp_items[0]['start_time'],
-                    "end_time": tmp_items[-1]['end_time'],
-                    "speaker_label": "spk_"+str(prev_speaker),
-                    "items": tmp_items
-                }
-                segments.append(tmp)
-            prev_speaker = speaker
-            tmp_items = []
-        
-        start = f"{word['start']:.2f}"
-        end = f"{word['end']:.2f}"
-        w = word["punctuated_word"]
-        tmp_items.append({
-            "start_time": start,
-            "end_time": end,
-            "speaker_label": "spk_"+str(speaker),
-            "content": w,
-        })
-    else:
-        tmp = {
-            "start_time": tmp_items[0]['start_time'],
-            "end_time": tmp_items[-1]['end_time'],
-            "speaker_label": "spk_"+str(speaker),
-            "items": tmp_items
-        }
-        segments.append(tmp)
-    new['results']['speaker_labels'] = {
-        "speakers": len(speakers),
-        "segments": segments,
-    }
-    return new
+    return Transcript.from_deepgram(data).to_wudpecker()
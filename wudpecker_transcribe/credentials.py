@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+
+from wudpecker_transcribe import http_client, serialization
+
+# Deepgram API key fetched from DEEPGRAM_TOKEN, cached per process. Once a
+# token is older than DEEPGRAM_TOKEN_REFRESH_AHEAD of its TTL it is refreshed
+# in the background while callers keep using the current one.
+
+_token = None
+_fetched_at = 0.0
+_refreshing = False
+_lock = threading.Lock()
+
+
+def _fetch_token():
+    res = http_client.get(os.getenv("DEEPGRAM_TOKEN"))
+    return serialization.loads(res.content)
+
+
+def _refresh():
+    global _token, _fetched_at, _refreshing
+    try:
+        token = _fetch_token()
+        with _lock:
+            _token, _fetched_at = token, time.monotonic()
+    finally:
+        _refreshing = False
+
+
+def deepgram_token():
+    global _token, _fetched_at, _refreshing
+    ttl = float(os.getenv("DEEPGRAM_TOKEN_TTL", 300))
+    age = time.monotonic() - _fetched_at
+    if _token is None or age >= ttl:
+        with _lock:
+            if _token is None or time.monotonic() - _fetched_at >= ttl:
+                _token = _fetch_token()
+                _fetched_at = time.monotonic()
+            return _token
+    if age >= ttl * float(os.getenv("DEEPGRAM_TOKEN_REFRESH_AHEAD", 0.8)) and not _refreshing:
+        _refreshing = True
+        threading.Thread(target=_refresh, daemon=True).start()
+    return _token
@@ -0,0 +1,68 @@
+import hashlib
+import os
+from uuid import uuid4
+
+from wudpecker_transcribe.redis_client import get_redis
+
+# Idempotent job submission: the first submission of a (task, uuid, url, langs)
+# combination reserves a task id in Redis, later submissions within
+# DEDUP_TTL get that task id back instead of enqueueing the work again.
+
+DEDUP_PREFIX = "wudpecker:job:"
+
+
+def dedup_ttl():
+    return int(os.getenv("DEDUP_TTL", 24 * 3600))
+
+
+def job_key(task_name, args):
+    parts = [task_name]
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            parts.append(",".join(sorted(arg)))
+        else:
+            parts.append(str(arg))
+    return DEDUP_PREFIX + hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def reserve_many(keys):
+    # returns (task_id, is_new) for every key in two round trips, plus two
+    # more for keys that expired between their SET and GET
+    redis = get_redis()
+    reserved = [None] * len(keys)
+    pending = list(range(len(keys)))
+    while pending:
+        candidates = [str(uuid4()) for _ in pending]
+        pipe = redis.pipeline(transaction=False)
+        for i, task_id in zip(pending, candidates):
+            pipe.set(keys[i], task_id, nx=True, ex=dedup_ttl())
+        created = pipe.execute()
+
+        taken = []
+        for i, task_id, new in zip(pending, candidates, created):
+            if new:
+                reserved[i] = (task_id, True)
+            else:
+                taken.append(i)
+
+        pipe = redis.pipeline(transaction=False)
+        for i in taken:
+            pipe.get(keys[i])
+        # a key that expired in between is only new once our SET succeeds
+        pending = []
+        for i, current in zip(taken, pipe.execute()):
+            if current is None:
+                pending.append(i)
+            else:
+                reserved[i] = (current.decode(), False)
+    return reserved
+
+
+def release(keys):
+    if keys:
+        get_redis().delete(*keys)
+
+
+def release_job(task_name, args):
+    # called when a task fails so a retry from upstream is not swallowed
+    release([job_key(task_name, args)])
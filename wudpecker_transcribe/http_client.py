@@ -0,0 +1,96 @@
+import os
+import threading
+
+# One pooled requests.Session per worker process, shared by every outbound
+# call (Azure, Deepgram, Recall, callbacks) so connections to the same hosts
+# are kept alive between tasks instead of paying a new TCP+TLS handshake.
+
+# Only idempotent requests (urllib3's default methods) are retried on these
+# statuses and on read errors. A POST creates an Azure job, pays for a
+# Deepgram transcription or delivers a callback, and a streamed body can not
+# be sent twice, so POSTs are only retried when the connection could not be
+# opened; everything else is left to the Celery task's retries.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def _env(name, default, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value else default
+
+
+def timeout(read=None):
+    return (
+        _env("HTTP_CONNECT_TIMEOUT", 5.0),
+        read if read is not None else _env("HTTP_READ_TIMEOUT", 60.0),
+    )
+
+
+def _make_session():
+    # the API only needs requests once a live session fetches a token
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=_env("HTTP_RETRIES", 3, int),
+        backoff_factor=_env("HTTP_BACKOFF", 0.5),
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_env("HTTP_POOL_HOSTS", 10, int),
+        pool_maxsize=_env("HTTP_POOL_SIZE", 10, int),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    global _session, _session_pid
+    # a session inherited over fork shares sockets with the parent, rebuild it
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _make_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", timeout())
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def pool_stats():
+    # urllib3 counts requests and newly opened connections per host pool;
+    # every request that did not open a connection reused a pooled one.
+    stats = {"requests": 0, "handshakes": 0}
+    if _session is None or _session_pid != os.getpid():
+        stats["pool_hits"] = 0
+        return stats
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["handshakes"] += pool.num_connections
+    stats["pool_hits"] = stats["requests"] - stats["handshakes"]
+    return stats
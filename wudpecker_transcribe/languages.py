@@ -0,0 +1,53 @@
+import functools
+from types import MappingProxyType
+
+# Engine selection for deepgram_transcribe. The language tables are built
+# once at import; a language matches a table entry either exactly or by its
+# base language ('pt-BR' -> 'pt'), like the old list scans did.
+
+DEEPGRAM_SINGLE = 'DEEPGRAM_SINGLE'
+DEEPGRAM_MULTI = 'DEEPGRAM_MULTI'
+AZURE_SINGLE = 'AZURE_SINGLE'
+AZURE_MULTI = 'AZURE_MULTI'
+
+DEEPGRAM_LANGS = frozenset(['da', 'nl', 'en', 'en-US', 'fr', 'de', 'hi', 'it', 'ja', 'ko', 'no', 'pl', 'pt', 'pt-BR', 'pt-PT', 'es', 'es-419', 'ta', 'sv'])
+NOVA_LANGS = frozenset(['en-US', 'es', 'en'])
+# Deepgram language code per supported language, exact codes win over bases
+DEEPGRAM_CODES = MappingProxyType({lang: lang for lang in DEEPGRAM_LANGS})
+
+# locales Azure picks from when the language of a recording is unknown
+AZURE_CANDIDATE_LOCALES = ("en-US", "da-DK", "fr-FR", "de-DE", "pt-BR", "ru-RU", "es-ES", "sv-SE")
+
+
+def base_lang(lang):
+    return lang.split('-')[0]
+
+
+def deepgram_code(lang):
+    # None when Deepgram does not support the language
+    code = DEEPGRAM_CODES.get(lang)
+    if code is None:
+        code = DEEPGRAM_CODES.get(base_lang(lang))
+    return code
+
+
+def is_nova(lang):
+    return lang in NOVA_LANGS or base_lang(lang) in NOVA_LANGS
+
+
+@functools.lru_cache(maxsize=4096)
+def _select_engine(langs):
+    nova = all(is_nova(lang) for lang in langs)
+    codes = [deepgram_code(lang) for lang in langs]
+    if len(langs) == 1:
+        if codes[0] is not None:
+            return DEEPGRAM_SINGLE, codes[0], nova
+        return AZURE_SINGLE, None, nova
+    if all(code is not None for code in codes):
+        return DEEPGRAM_MULTI, None, nova
+    return AZURE_MULTI, None, nova
+
+
+def select_engine(langs):
+    # (status, Deepgram language code or None, nova)
+    return _select_engine(tuple(langs))
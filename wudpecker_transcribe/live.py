@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+from urllib.parse import urlencode
+
+import aiohttp
+
+from wudpecker_transcribe import credentials, metrics, rate_limit, serialization
+from wudpecker_transcribe.transcript_model import Transcript
+
+# Live transcription sessions. Audio frames received on the /live websocket
+# are relayed to a streaming backend (LIVE_BACKEND: "deepgram", or "local" for
+# a stand-in that needs no provider) and every final result is sent back as
+# segments in the same speaker_labels.segments shape parse_deepgram produces.
+# Consecutive messages may continue the same speaker; merging adjacent
+# segments with the same label gives the batch result.
+#
+# Buffers are bounded on both sides: the websocket is not read while
+# LIVE_AUDIO_QUEUE frames wait for the backend, so a slow provider pushes
+# back on the client over TCP, and results are only read from the backend as
+# fast as the client takes them.
+
+DEEPGRAM_LIVE_DEFAULTS = {"diarize": "true", "punctuate": "true", "interim_results": "true", "numerals": "true"}
+CLOSE_STREAM = '{"type": "CloseStream"}'
+
+_sessions = None
+
+
+def _env(name, default):
+    return float(os.getenv(name, default))
+
+
+def session_slots():
+    # created lazily, a semaphore binds to the running event loop
+    global _sessions
+    if _sessions is None:
+        _sessions = asyncio.Semaphore(int(_env("LIVE_MAX_SESSIONS", 500)))
+    return _sessions
+
+
+async def run_sync(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+class DeepgramLiveBackend:
+
+    def __init__(self, lang=None, nova=True, **audio):
+        self.lang = lang
+        self.nova = nova
+        # encoding / sample_rate / channels, needed for raw PCM only
+        self.audio = {key: value for key, value in audio.items() if value}
+        self.session = None
+        self.ws = None
+
+    def url(self):
+        params = dict(DEEPGRAM_LIVE_DEFAULTS, model="nova" if self.nova else "general-enhanced", **self.audio)
+        if self.lang:
+            params["language"] = self.lang
+        base = os.getenv("DEEPGRAM_API_URL", "https://api.deepgram.com").replace("http", "ws", 1)
+        return f"{base}/v1/listen?{urlencode(params)}"
+
+    async def connect(self):
+        key = os.getenv("PROD_DEEPGRAM") if self.nova else await run_sync(credentials.deepgram_token)
+        await run_sync(rate_limit.acquire, "deepgram_live", "prod" if self.nova else "shared")
+        self.session = aiohttp.ClientSession()
+        self.ws = await self.session.ws_connect(self.url(), headers={"Authorization": "Token " + key}, heartbeat=20)
+
+    async def send(self, frame):
+        await self.ws.send_bytes(frame)
+
+    async def finish(self):
+        await self.ws.send_str(CLOSE_STREAM)
+
+    async def results(self):
+        async for message in self.ws:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                data = serialization.loads(message.data)
+                if data.get("type") == "Results":
+                    yield data
+            elif message.type == aiohttp.WSMsgType.ERROR:
+                raise self.ws.exception()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.session is not None:
+            await self.session.close()
+
+
+class LocalLiveBackend:
+    # Stand-in producing Deepgram shaped results from the audio byte count:
+    # one word per LIVE_LOCAL_WORD_SECONDS of audio at LIVE_LOCAL_BYTES_PER_SECOND
+    # (16 kHz 16 bit mono by default), the speaker changing every 7 words.
+
+    VOCABULARY = "we should ship the release after the design review next week".split()
+
+    def __init__(self, lang=None, nova=True, **audio):
+        self.bytes_per_second = _env("LIVE_LOCAL_BYTES_PER_SECOND", 32000)
+        self.word_seconds = _env("LIVE_LOCAL_WORD_SECONDS", 0.4)
+        self.received = 0
+        self.emitted = 0
+        self.queue = asyncio.Queue(maxsize=int(_env("LIVE_RESULT_QUEUE", 64)))
+
+    async def connect(self):
+        pass
+
+    def _word(self, index):
+        start = index * self.word_seconds
+        content = self.VOCABULARY[index % len(self.VOCABULARY)]
+        return {"word": content, "punctuated_word": content, "start": start, "end": start + self.word_seconds * 0.8,
+                "confidence": 1.0, "speaker": index // 7 % 2}
+
+    async def send(self, frame):
+        self.received += len(frame)
+        available = int(self.received / self.bytes_per_second / self.word_seconds)
+        if available > self.emitted:
+            words = [self._word(i) for i in range(self.emitted, available)]
+            self.emitted = available
+            transcript = " ".join(word["punctuated_word"] for word in words)
+            alternative = {"transcript": transcript, "words": words}
+            start = words[0]["start"]
+            await self.queue.put({"type": "Results", "is_final": False, "start": start, "channel": {"alternatives": [dict(alternative, words=[])]}})
+            await self.queue.put({"type": "Results", "is_final": True, "start": start, "channel": {"alternatives": [alternative]}})
+
+    async def finish(self):
+        await self.queue.put(None)
+
+    async def results(self):
+        while True:
+            result = await self.queue.get()
+            if result is None:
+                return
+            yield result
+
+    async def close(self):
+        pass
+
+
+BACKENDS = {
+    "deepgram": DeepgramLiveBackend,
+    "local": LocalLiveBackend,
+}
+
+
+def make_backend(**params):
+    return BACKENDS[os.getenv("LIVE_BACKEND", "deepgram")](**params)
+
+
+def result_message(result):
+    # websocket message for one backend result, None when there is nothing to send
+    alternative = result["channel"]["alternatives"][0]
+    if not result.get("is_final"):
+        if not alternative.get("transcript"):
+            return None
+        return {"type": "partial", "start": result.get("start"), "transcript": alternative["transcript"]}
+    if not alternative.get("words"):
+        return None
+    data = {"results": {"channels": [{"alternatives": [alternative]}]}}
+    segments = Transcript.from_deepgram(data).to_wudpecker()["results"]["speaker_labels"]["segments"]
+    return {"type": "segments", "transcript": alternative["transcript"], "segments": segments}
+
+
+async def relay(websocket, backend):
+    max_frame = int(_env("LIVE_MAX_FRAME", 1024 * 1024))
+    audio = asyncio.Queue(maxsize=int(_env("LIVE_AUDIO_QUEUE", 32)))
+    idle = _env("LIVE_IDLE_TIMEOUT", 30)
+
+    async def receive_audio():
+        try:
+            while True:
+                message = await asyncio.wait_for(websocket.receive(), idle)
+                if message["type"] == "websocket.disconnect":
+                    return
+                frame = message.get("bytes")
+                if frame is not None:
+                    if len(frame) > max_frame:
+                        raise ValueError(f"Audio frame larger than {max_frame} bytes")
+                    # blocks while the queue is full: the client is not read
+                    await audio.put(frame)
+                elif message.get("text"):
+                    if json.loads(message["text"]).get("type") == "CloseStream":
+                        return
+        finally:
+            await audio.put(None)
+
+    async def send_audio():
+        while True:
+            frame = await audio.get()
+            if frame is None:
+                break
+            await backend.send(frame)
+        await backend.finish()
+
+    async def send_results():
+        async for result in backend.results():
+            message = result_message(result)
+            if message is not None:
+                await websocket.send_text(serialization.dumps(message).decode())
+
+    tasks = [asyncio.ensure_future(job) for job in (receive_audio(), send_audio(), send_results())]
+    try:
+        # results end once the backend has flushed everything after finish()
+        await tasks[2]
+        await asyncio.gather(*tasks[:2])
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_session(websocket, **params):
+    slots = session_slots()
+    if slots.locked():
+        # 1013: try again later
+        await websocket.close(code=1013)
+        return
+    async with slots:
+        await websocket.accept()
+        metrics.LIVE_SESSIONS.inc()
+        backend = None
+        try:
+            backend = make_backend(**params)
+            await backend.connect()
+            await relay(websocket, backend)
+            await websocket.send_text(serialization.dumps({"type": "done"}).decode())
+            await websocket.close()
+        except Exception as e:
+            try:
+                await websocket.send_text(serialization.dumps({"type": "error", "msg": str(e)}).decode())
+                await websocket.close(code=1011)
+            except Exception:
+                pass
+        finally:
+            metrics.LIVE_SESSIONS.dec()
+            if backend is not None:
+                await backend.close()
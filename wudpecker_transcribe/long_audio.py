@@ -0,0 +1,182 @@
+import bisect
+import os
+import subprocess
+from urllib.parse import unquote, urlparse
+
+from wudpecker_transcribe import audio_source
+
+# Long recordings are cut into overlapping windows with ffmpeg, transcribed in
+# parallel and stitched back into a single Deepgram style response. The
+# source is the url from the API request: http(s) urls are read with only the
+# network protocols allowed, so a url can not make ffmpeg read local files
+# (file:, concat:, subfile:, playlists). Local paths are read with only the
+# file protocol and, as for streaming, only under AUDIO_LOCAL_ROOT.
+
+# words of neighbouring chunks closer than this are considered the same word
+MATCH_TOLERANCE = 0.3
+
+URL_SCHEMES = ("http", "https")
+URL_PROTOCOLS = "http,https,tls,tcp"
+
+
+def _env(name, default):
+    return float(os.getenv(name, default))
+
+
+def ffmpeg_input(source):
+    # (input, protocol whitelist) for ffmpeg, None when the source may not be read
+    parsed = urlparse(source)
+    if parsed.scheme.lower() in URL_SCHEMES:
+        return source, URL_PROTOCOLS
+    if parsed.scheme in ("", "file"):
+        path = audio_source.local_path(unquote(parsed.path))
+        if path is not None:
+            return "file:" + path, "file"
+    return None
+
+
+def probe_duration(source):
+    allowed = ffmpeg_input(source)
+    if allowed is None:
+        return None
+    source, protocols = allowed
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-protocol_whitelist", protocols,
+             "-show_entries", "format=duration", "-of", "csv=p=0", source],
+            capture_output=True, text=True, timeout=_env("FFPROBE_TIMEOUT", 60), check=True,
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def plan_windows(duration, window, overlap):
+    windows = []
+    start = 0.0
+    while start < duration:
+        end = min(start + window, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start = end - overlap
+    return windows
+
+
+def windows_for(source):
+    # None when long audio mode is off (LONG_AUDIO_SECONDS=0) or the source is short
+    threshold = _env("LONG_AUDIO_SECONDS", 0)
+    if threshold <= 0:
+        return None
+    duration = probe_duration(source)
+    if duration is None or duration <= threshold:
+        return None
+    return plan_windows(duration, _env("CHUNK_SECONDS", 900), _env("CHUNK_OVERLAP_SECONDS", 30))
+
+
+def extract_chunk(source, start, end):
+    allowed = ffmpeg_input(source)
+    if allowed is None:
+        raise ValueError("Only http(s) audio urls and files under AUDIO_LOCAL_ROOT can be split into chunks")
+    source, protocols = allowed
+    # mono 16 kHz FLAC is lossless for speech and a fraction of the wav size
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-protocol_whitelist", protocols,
+         "-ss", str(start), "-t", str(end - start), "-i", source,
+         "-vn", "-ac", "1", "-ar", "16000", "-f", "flac", "pipe:1"],
+        capture_output=True, timeout=_env("FFMPEG_TIMEOUT", 600), check=True,
+    )
+    return result.stdout
+
+
+def _words(response):
+    return response["results"]["channels"][0]["alternatives"][0]["words"]
+
+
+def _normalize(word):
+    return word.get("word") or word["punctuated_word"].lower().strip(".,!?")
+
+
+def reconcile_speakers(previous, current):
+    # previous: already stitched words (global speakers) inside the overlap,
+    # current: words of the new chunk (chunk local speakers) inside it.
+    # Every word heard by both chunks is a vote for local -> global.
+    starts = [word["start"] for word in previous]
+    votes = {}
+    for word in current:
+        i = bisect.bisect_left(starts, word["start"] - MATCH_TOLERANCE)
+        while i < len(previous) and previous[i]["start"] <= word["start"] + MATCH_TOLERANCE:
+            if _normalize(previous[i]) == _normalize(word):
+                pair = (word["speaker"], previous[i]["speaker"])
+                votes[pair] = votes.get(pair, 0) + 1
+                break
+            i += 1
+
+    mapping = {}
+    taken = set()
+    for (local, speaker), _ in sorted(votes.items(), key=lambda vote: -vote[1]):
+        if local in mapping or speaker in taken:
+            continue
+        mapping[local] = speaker
+        taken.add(speaker)
+    return mapping
+
+
+def _heard(words, word_starts, end, word):
+    # word is among words[:end] within MATCH_TOLERANCE of its start
+    i = bisect.bisect_left(word_starts, word["start"] - MATCH_TOLERANCE, 0, end)
+    while i < end and word_starts[i] <= word["start"] + MATCH_TOLERANCE:
+        if _normalize(words[i]) == _normalize(word):
+            return True
+        i += 1
+    return False
+
+
+def stitch_chunks(chunks):
+    # chunks: [{"start", "end", "response"}], response times relative to start
+    words = []
+    word_starts = []
+    next_speaker = 0
+    previous_end = None
+    for chunk in sorted(chunks, key=lambda c: c["start"]):
+        offset = chunk["start"]
+        local = [dict(word, start=word["start"] + offset, end=word["end"] + offset) for word in _words(chunk["response"])]
+
+        if previous_end is None:
+            mapping = {}
+            cut = float("-inf")
+        else:
+            # keep the earlier chunk up to the middle of the overlap, the new one after it
+            cut = (offset + previous_end) / 2
+            overlap_start = bisect.bisect_left(word_starts, offset)
+            mapping = reconcile_speakers(words[overlap_start:], [w for w in local if w["start"] <= previous_end])
+            keep = bisect.bisect_left(word_starts, cut)
+            del words[keep:]
+            del word_starts[keep:]
+
+        boundary = len(words)
+        for word in local:
+            if word["start"] < cut - MATCH_TOLERANCE:
+                continue
+            # the chunks can place the same word on different sides of the cut
+            if word["start"] < cut + MATCH_TOLERANCE and _heard(words, word_starts, boundary, word):
+                continue
+            if word["speaker"] not in mapping:
+                mapping[word["speaker"]] = next_speaker
+                next_speaker += 1
+            word["speaker"] = mapping[word["speaker"]]
+            words.append(word)
+            word_starts.append(word["start"])
+        previous_end = chunk["end"]
+
+    return {
+        "metadata": {"chunks": len(chunks), "duration": previous_end or 0},
+        "results": {
+            "channels": [{
+                "alternatives": [{
+                    "transcript": " ".join(word["punctuated_word"] for word in words),
+                    "words": words,
+                }],
+            }],
+        },
+    }
@@ -1,55 +1,231 @@
-from fastapi import FastAPI, Request, Body
+from fastapi import FastAPI, Request, Body, WebSocket
+import asyncio
+import json
 import os 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import PlainTextResponse
-import json
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.routing import APIRoute
+from typing import List, Optional
+from uuid import uuid4
 
-from wudpecker_transcribe.celery_config import celery_app, create_transcript, get_transcript, deepgram_transcribe, create_transcript_manual
+from wudpecker_transcribe import admission, live, metrics, search_index, serialization, transcript_store
+from wudpecker_transcribe.broker import BULK_PRIORITY, PROVIDER_QUEUE, celery_app, priority_for, signature as task_signature
+from wudpecker_transcribe.dedup import job_key, release, reserve_many
+from wudpecker_transcribe.schemas import AzureNotification, CreateRequest, DeepgramStartRequest
 
 load_dotenv()
 
-app = FastAPI()
+
+class FastJSONRequest(Request):
+    async def json(self):
+        if not hasattr(self, "_json"):
+            try:
+                self._json = serialization.loads(await self.body())
+            except json.JSONDecodeError:
+                raise
+            except ValueError as e:
+                # ujson raises plain ValueErrors, FastAPI only turns JSONDecodeError into a 400
+                raise json.JSONDecodeError(str(e), "", 0)
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    # decode request bodies with the accelerated serializer
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return serialization.dumps(content)
+
+
+app = FastAPI(default_response_class=FastJSONResponse)
+app.router.route_class = FastJSONRoute
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10000))
+ADMISSION_RELEASE_INTERVAL = float(os.getenv("ADMISSION_RELEASE_INTERVAL", 2))
+
+admission_control = admission.Admission(celery_app.conf.broker_url, [PROVIDER_QUEUE])
+
+
+def create_signature(job, priority='interactive'):
+    if job.lang == 'NaN':
+        signature = task_signature("create_transcript", job.uuid, job.url)
+    else:
+        signature = task_signature("create_transcript_manual", job.uuid, job.url, job.lang)
+    return signature.set(priority=priority_for(job.priority or priority))
+
+
+def deepgram_signature(job, priority='interactive'):
+    signature = task_signature("deepgram_transcribe", job.uuid, job.url, job.langs)
+    return signature.set(priority=priority_for(job.priority or priority))
+
+
+def admit(signatures):
+    # a batch is only held back as bulk when every job in it is bulk
+    bulk = all(signature.options.get("priority", 0) >= BULK_PRIORITY for signature in signatures)
+    decision = admission_control.decide(len(signatures), bulk)
+    metrics.ADMISSION_DECISIONS.labels(decision, "yes" if bulk else "no").inc()
+    if decision == admission.REJECT:
+        raise HTTPException(status_code=429, detail="Too many jobs queued, retry later",
+                            headers={"Retry-After": str(admission_control.retry_after())})
+    return decision
+
+
+def enqueue(signatures, dedup=True, admit_jobs=True):
+    if dedup:
+        keys = [job_key(signature.task, signature.args) for signature in signatures]
+        reserved = reserve_many(keys)
+    else:
+        keys = []
+        reserved = [(None, True)] * len(signatures)
+    # duplicates are answered with their task id and do not add load
+    new_jobs = [signature for signature, (_, new) in zip(signatures, reserved) if new]
+    decision = admission.ADMIT
+    if admit_jobs and new_jobs:
+        try:
+            decision = admit(new_jobs)
+        except HTTPException:
+            release([key for key, (_, new) in zip(keys, reserved) if new])
+            raise
+    if decision == admission.HOLD:
+        return hold(signatures, keys, reserved)
+    try:
+        # publish every new message over one pooled broker connection
+        with celery_app.producer_or_acquire() as producer:
+            task_ids = [
+                signature.apply_async(producer=producer, task_id=task_id).id if new else task_id
+                for signature, (task_id, new) in zip(signatures, reserved)
+            ]
+    except Exception:
+        release([key for key, (_, new) in zip(keys, reserved) if new])
+        raise
+    for signature, (_, new) in zip(signatures, reserved):
+        if new:
+            metrics.JOBS_ENQUEUED.labels(signature.task, signature.options.get("priority", "")).inc()
+    return task_ids
+
+
+def hold(signatures, keys, reserved):
+    # the reserved task ids are kept, a released job runs under the same id
+    reserved = [(task_id or str(uuid4()), new) for task_id, new in reserved]
+    jobs = [{
+        "task": signature.task,
+        "args": list(signature.args),
+        "task_id": task_id,
+        "priority": signature.options.get("priority"),
+    } for signature, (task_id, new) in zip(signatures, reserved) if new]
+    try:
+        if jobs:
+            admission_control.hold(jobs)
+    except Exception:
+        release([key for key, (_, new) in zip(keys, reserved) if new])
+        raise
+    return [task_id for task_id, _ in reserved]
+
+
+async def enqueue_batch(signatures):
+    if len(signatures) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} jobs per batch")
+    task_ids = await run_in_threadpool(enqueue, signatures)
+    return {"task_ids": task_ids}
+
+
+async def release_held_jobs():
+    while True:
+        await asyncio.sleep(ADMISSION_RELEASE_INTERVAL)
+        try:
+            await run_in_threadpool(admission_control.release_held, celery_app.send_task)
+        except Exception as e:
+            print("Releasing held jobs failed:", repr(e), flush=True)
+
+
+@app.on_event("startup")
+async def start_admission():
+    if admission_control.max_load() > 0:
+        asyncio.ensure_future(release_held_jobs())
+
 
 @app.get("/")
 def root():
     return {"message": "Things work"}
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+@app.get("/search")
+async def search(q: str, limit: int = Query(20, ge=1, le=100), hits: int = Query(10, ge=0, le=1000), offset: int = Query(0, ge=0)):
+    return await run_in_threadpool(search_index.search, q, limit, hits, offset)
+
+
+@app.get("/transcripts/{uuid}")
+async def transcript_range(uuid: str, start: float = 0.0, end: Optional[float] = None):
+    # segments overlapping [start, end) seconds, from the windowed layout
+    try:
+        return await run_in_threadpool(transcript_store.read_range, uuid, start, end)
+    except transcript_store.TranscriptNotFound:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+
+
+@app.get("/transcripts/{uuid}/header")
+async def transcript_header(uuid: str):
+    try:
+        return await run_in_threadpool(transcript_store.read_header, uuid)
+    except transcript_store.TranscriptNotFound:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+
+
 @app.post("/create")
-async def create(request: Request):
-    request_body = await request.body()
-    request_data = json.loads(request_body)
-    uuid = request_data.get('uuid')
-    url = request_data.get('url')
-    lang = request_data.get('lang', 'NaN')
-    if lang == 'NaN':
-        task = create_transcript.delay(uuid, url)
-    else:
-        task = create_transcript_manual.delay(uuid, url, lang)
-    return {"task_id": task.id}
+async def create(job: CreateRequest):
+    task_ids = await run_in_threadpool(enqueue, [create_signature(job)])
+    return {"task_id": task_ids[0]}
 
 
+@app.post("/create/batch")
+async def create_batch(jobs: List[CreateRequest]):
+    return await enqueue_batch([create_signature(job, 'bulk') for job in jobs])
+
     
 @app.post("/done")
 async def done(request: Request):
+    # the query token is checked before the body, whatever the handshake sends as body
     validation_token = request.query_params.get('validationToken')
     if validation_token:
         return PlainTextResponse(validation_token)
     request_body = await request.body()
-    request_data = json.loads(request_body)
-    url = request_data.get('self')
-    task = get_transcript.delay(url)
-    return {"task_id": task.id}
+    try:
+        notification = AzureNotification.parse_obj(serialization.loads(request_body))
+    except ValueError as e:
+        # pydantic's ValidationError and JSON decode errors are both ValueErrors
+        raise HTTPException(status_code=422, detail=f"Invalid notification: {e}")
+    task_ids = await run_in_threadpool(enqueue, [task_signature("get_transcript", notification.self_url)], False, False)
+    return {"task_id": task_ids[0]}
     
 @app.post("/deepgram/start")
-async def deepgram_start(request: Request):
-    request_body = await request.body()
-    request_data = json.loads(request_body)
-    uuid = request_data.get('uuid')
-    url = request_data.get('url')
-    lang_string = request_data.get('lang','')
-    langs = [] if lang_string == '' else list(set(lang_string.split(',')))
-    task = deepgram_transcribe.delay(uuid, url, langs)
-    return {"task_id": task.id}
-    
\ No newline at end of file
+async def deepgram_start(job: DeepgramStartRequest):
+    task_ids = await run_in_threadpool(enqueue, [deepgram_signature(job)])
+    return {"task_id": task_ids[0]}
+
+
+@app.post("/deepgram/start/batch")
+async def deepgram_start_batch(jobs: List[DeepgramStartRequest]):
+    return await enqueue_batch([deepgram_signature(job, 'bulk') for job in jobs])
+
+
+@app.websocket("/live")
+async def live_transcribe(websocket: WebSocket, lang: str = '', nova: bool = True,
+                          encoding: str = '', sample_rate: str = '', channels: str = ''):
+    await live.run_session(websocket, lang=lang or None, nova=nova,
+                           encoding=encoding, sample_rate=sample_rate, channels=channels)
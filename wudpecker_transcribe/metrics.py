@@ -0,0 +1,94 @@
+import os
+from datetime import datetime
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+# Prometheus metrics shared by the API and the Celery workers. With
+# PROMETHEUS_MULTIPROC_DIR set (a directory shared by every process on the
+# host, emptied on start) each process writes its samples there and
+# /metrics on the API aggregates them; without it only the API process's
+# own metrics are exposed.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+WORD_BUCKETS = (0, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+PROVIDER_SECONDS = Histogram(
+    "wudpecker_provider_request_seconds", "Provider API call latency",
+    ["provider", "route"], buckets=SECONDS_BUCKETS)
+PARSE_SECONDS = Histogram(
+    "wudpecker_parse_seconds", "Provider response parsing time",
+    ["provider"], buckets=SECONDS_BUCKETS)
+MATCH_SECONDS = Histogram(
+    "wudpecker_speaker_match_seconds", "Recall speaker matching time",
+    buckets=SECONDS_BUCKETS)
+S3_UPLOAD_SECONDS = Histogram(
+    "wudpecker_s3_upload_seconds", "Transcript upload time",
+    buckets=SECONDS_BUCKETS)
+S3_UPLOAD_BYTES = Histogram(
+    "wudpecker_s3_upload_bytes", "Uploaded transcript size",
+    buckets=BYTES_BUCKETS)
+CALLBACK_SECONDS = Histogram(
+    "wudpecker_callback_seconds", "Callback request latency",
+    ["callback"], buckets=SECONDS_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram(
+    "wudpecker_queue_wait_seconds", "Time between publish and task start",
+    ["task"], buckets=SECONDS_BUCKETS)
+TRANSCRIPT_WORDS = Histogram(
+    "wudpecker_transcript_words", "Words per transcript",
+    ["provider"], buckets=WORD_BUCKETS)
+CALLBACKS = Counter(
+    "wudpecker_callbacks_total", "Callback delivery attempts by outcome",
+    ["callback", "result"])
+OUTBOX_DEPTH = Gauge(
+    "wudpecker_callback_outbox_depth", "Callbacks in the outbox by state",
+    ["state"], multiprocess_mode="livemax")
+LIVE_SESSIONS = Gauge(
+    "wudpecker_live_sessions", "Open live transcription sessions",
+    multiprocess_mode="livesum")
+JOBS_ENQUEUED = Counter(
+    "wudpecker_jobs_enqueued_total", "Jobs published by the API",
+    ["task", "priority"])
+ADMISSION_DECISIONS = Counter(
+    "wudpecker_admission_decisions_total", "Admission decisions of the API, per request",
+    ["decision", "bulk"])
+
+# task message header set on publish, read when the task starts
+PUBLISHED_AT_HEADER = "published_at"
+
+
+def multiprocess_enabled():
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def publish_time(headers, now):
+    # a countdown/eta task is not waiting in the queue before its eta
+    eta = headers.get("eta")
+    if eta:
+        try:
+            return max(now, datetime.fromisoformat(eta).timestamp())
+        except (TypeError, ValueError):
+            pass
+    return now
+
+
+def observe_queue_wait(task_name, published_at, now):
+    try:
+        QUEUE_WAIT_SECONDS.labels(task_name).observe(max(now - float(published_at), 0))
+    except (TypeError, ValueError):
+        pass
+
+
+def mark_process_dead(pid):
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+
+def render():
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
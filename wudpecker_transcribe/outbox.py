@@ -0,0 +1,48 @@
+import os
+import time
+
+import redis
+
+from wudpecker_transcribe import http_client, metrics, serialization
+from wudpecker_transcribe.redis_client import get_redis
+
+# Callbacks to the wudpecker backend are written to a Redis stream instead of
+# being posted by the task. callback_dispatcher delivers them concurrently,
+# batches them where the receiver has a batch endpoint and retries failures
+# with backoff, so a slow or unavailable backend neither blocks workers nor
+# loses notifications.
+
+STREAM_KEY = "wudpecker:outbox"
+# retries waiting for their backoff, scored by due time
+DELAYED_KEY = "wudpecker:outbox:delayed"
+# entries that ran out of attempts
+DEAD_KEY = "wudpecker:outbox:dead"
+GROUP = "dispatchers"
+
+
+def enabled():
+    return os.getenv("CALLBACK_OUTBOX", "1").lower() not in ("0", "false", "no")
+
+
+def entry(kind, url, data=None, json=None):
+    # body is kept as text so the entry can round trip through JSON when delayed
+    if json is not None:
+        encoding, body = "json", serialization.dumps(json).decode()
+    elif isinstance(data, dict):
+        encoding, body = "form", serialization.dumps(data).decode()
+    else:
+        encoding = "raw"
+        body = data.decode() if isinstance(data, bytes) else (data or "")
+    return {"kind": kind, "url": url, "encoding": encoding, "body": body, "attempts": 0, "queued_at": time.time()}
+
+
+def send(kind, url, data=None, json=None):
+    if enabled():
+        try:
+            get_redis().xadd(STREAM_KEY, entry(kind, url, data=data, json=json))
+            return None
+        except redis.RedisError:
+            pass
+    # outbox unavailable, deliver right away
+    with metrics.CALLBACK_SECONDS.labels(kind).time():
+        return http_client.post(url, data=data, json=json)
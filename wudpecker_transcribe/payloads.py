@@ -0,0 +1,56 @@
+import gzip
+import os
+import uuid
+
+import redis
+
+from wudpecker_transcribe import serialization, storage
+from wudpecker_transcribe.redis_client import get_redis
+
+# Large intermediate documents (provider responses, formatted transcripts)
+# handed between pipeline stages. Only a short reference travels through the
+# broker; the document itself is kept gzipped in Redis, or in S3 when it is
+# bigger than PAYLOAD_REDIS_MAX_BYTES.
+
+PAYLOAD_PREFIX = "wudpecker:payload:"
+S3_PREFIX = "pipeline/"
+
+
+def payload_ttl():
+    return int(os.getenv("PAYLOAD_TTL", 24 * 3600))
+
+
+def put(obj):
+    name = uuid.uuid4().hex
+    value = gzip.compress(serialization.dumps(obj), compresslevel=1)
+    if len(value) <= int(os.getenv("PAYLOAD_REDIS_MAX_BYTES", 16 * 1024 * 1024)):
+        try:
+            get_redis().set(PAYLOAD_PREFIX + name, value, ex=payload_ttl())
+            return "redis:" + name
+        except redis.RedisError:
+            pass
+    storage.get_s3().put_object(Bucket=os.getenv("BUCKET_NAME"), Key=S3_PREFIX + name + ".json.gz", Body=value)
+    return "s3:" + name
+
+
+def get(ref):
+    store, _, name = ref.partition(":")
+    if store == "redis":
+        value = get_redis().get(PAYLOAD_PREFIX + name)
+        if value is None:
+            raise KeyError(f"Payload {ref} expired")
+    else:
+        value = storage.get_s3().get_object(Bucket=os.getenv("BUCKET_NAME"), Key=S3_PREFIX + name + ".json.gz")["Body"].read()
+    return serialization.loads(gzip.decompress(value))
+
+
+def delete(ref):
+    store, _, name = ref.partition(":")
+    try:
+        if store == "redis":
+            get_redis().delete(PAYLOAD_PREFIX + name)
+        else:
+            storage.get_s3().delete_object(Bucket=os.getenv("BUCKET_NAME"), Key=S3_PREFIX + name + ".json.gz")
+    except Exception:
+        # expires on its own (Redis TTL / bucket lifecycle rule on pipeline/)
+        pass
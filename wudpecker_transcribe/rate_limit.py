@@ -0,0 +1,83 @@
+import hashlib
+import os
+import time
+
+import redis
+
+from wudpecker_transcribe.redis_client import get_redis
+
+# Distributed token bucket per provider and API key, shared by every worker
+# through Redis. Limits come from RATE_LIMITS, e.g.
+#   RATE_LIMITS="deepgram=2:20,azure=0.5:5"
+# meaning <tokens per second>:<burst>. Providers without a limit are not
+# throttled.
+
+BUCKET_PREFIX = "wudpecker:ratelimit:"
+
+# Refill and take in one atomic step, timed with the Redis clock so workers
+# on different hosts agree.
+TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+_script = None
+
+
+class RateLimited(Exception):
+    pass
+
+
+def limits():
+    parsed = {}
+    for entry in os.getenv("RATE_LIMITS", "").split(","):
+        if "=" not in entry:
+            continue
+        provider, _, spec = entry.partition("=")
+        rate, _, burst = spec.partition(":")
+        parsed[provider.strip()] = (float(rate), float(burst or rate))
+    return parsed
+
+
+def acquire(provider, api_key="", tokens=1, max_wait=None):
+    limit = limits().get(provider)
+    if limit is None:
+        return 0.0
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(TOKEN_BUCKET)
+    if max_wait is None:
+        max_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT", 300))
+
+    key_id = hashlib.sha1((api_key or "").encode()).hexdigest()[:12]
+    bucket = f"{BUCKET_PREFIX}{provider}:{key_id}"
+    rate, burst = limit
+    waited = 0.0
+    while True:
+        try:
+            wait = float(_script(keys=[bucket], args=[rate, burst, tokens], client=get_redis()))
+        except redis.RedisError:
+            # without Redis the limit cannot be coordinated, let the call through
+            return waited
+        if wait <= 0:
+            return waited
+        if waited + wait > max_wait:
+            raise RateLimited(f"{provider} rate limit: no token within {max_wait}s")
+        time.sleep(wait)
+        waited += wait
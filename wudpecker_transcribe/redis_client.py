@@ -0,0 +1,27 @@
+import os
+
+import redis
+
+# Shared Redis connection for application state (dedup keys, caches, job
+# tracking). Celery's broker/backend connections are managed by Celery.
+
+_client = None
+_client_pid = None
+
+
+def redis_url():
+    return f"redis://{os.getenv('REDIS_URL')}:6379/{os.getenv('REDIS_STATE_DB', '3')}"
+
+
+def get_redis():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.Redis.from_url(redis_url())
+        _client_pid = os.getpid()
+    return _client
+
+
+def get_async_redis():
+    # one client per event loop, callers own and close it
+    import redis.asyncio
+    return redis.asyncio.Redis.from_url(redis_url())
@@ -0,0 +1,78 @@
+import gzip
+import hashlib
+import os
+
+import redis
+
+from wudpecker_transcribe import audio_source, http_client, serialization
+from wudpecker_transcribe.redis_client import get_redis
+
+# Raw provider responses keyed by the audio content (ETag / S3 version id and
+# size of the source) and the engine settings that produced them, so
+# re-submitting the same recording skips the provider call. Every entry is
+# written with a TTL (RESULT_CACHE_TTL). This Redis also holds the Celery
+# broker and results, dedup reservations, the callback outbox and the Azure
+# pending set, none of which may be evicted: use maxmemory-policy
+# volatile-lru or volatile-ttl so only expiring keys like these are evicted
+# under memory pressure (never allkeys-*), or point the cache at its own
+# Redis.
+
+CACHE_PREFIX = "wudpecker:result:"
+
+
+def cache_ttl():
+    return int(os.getenv("RESULT_CACHE_TTL", 7 * 24 * 3600))
+
+
+def source_fingerprint(url):
+    source = audio_source.resolve(url)
+    if source is not None:
+        return audio_source.fingerprint(source)
+    # A one byte ranged GET works for presigned GET urls where HEAD does not
+    try:
+        response = http_client.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+    except Exception:
+        return None
+    with response:
+        if response.status_code >= 400:
+            return None
+        headers = response.headers
+        size = headers.get("Content-Range", "").rpartition("/")[2] or headers.get("Content-Length", "")
+        version = headers.get("x-amz-version-id") or headers.get("ETag")
+        if not version:
+            return None
+        return f"{version}|{size}"
+
+
+def cache_key(url, engine, model, lang):
+    if cache_ttl() <= 0:
+        return None
+    fingerprint = source_fingerprint(url)
+    if fingerprint is None:
+        return None
+    raw = f"{fingerprint}|{engine}|{model}|{lang or 'detect'}"
+    return CACHE_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def load(key):
+    try:
+        value = get_redis().get(key)
+    except redis.RedisError:
+        return None
+    if value is None:
+        return None
+    return serialization.loads(gzip.decompress(value))
+
+
+def store(key, response):
+    if cache_ttl() <= 0:
+        # no entry without a TTL, see the eviction note above
+        return False
+    value = gzip.compress(serialization.dumps(response), compresslevel=6)
+    if len(value) > int(os.getenv("RESULT_CACHE_MAX_BYTES", 32 * 1024 * 1024)):
+        return False
+    try:
+        get_redis().set(key, value, ex=cache_ttl())
+    except redis.RedisError:
+        return False
+    return True
@@ -0,0 +1,28 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+# unset means interactive for single jobs and bulk for batches
+Priority = Literal['interactive', 'default', 'bulk']
+
+
+class CreateRequest(BaseModel):
+    uuid: str
+    url: str
+    lang: str = 'NaN'
+    priority: Optional[Priority] = None
+
+
+class DeepgramStartRequest(BaseModel):
+    uuid: str
+    url: str
+    lang: str = ''
+    priority: Optional[Priority] = None
+
+    @property
+    def langs(self):
+        return [] if self.lang == '' else list(set(self.lang.split(',')))
+
+
+class AzureNotification(BaseModel):
+    self_url: str = Field(alias='self')
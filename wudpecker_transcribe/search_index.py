@@ -0,0 +1,128 @@
+import os
+import re
+import uuid as uuidlib
+from array import array
+
+from wudpecker_transcribe import serialization
+from wudpecker_transcribe.redis_client import get_redis
+
+# Word index over completed transcripts, kept in Redis:
+#   wudpecker:search:term:<term>  zset uuid -> occurrences, the shard a
+#                                  query intersects
+#   wudpecker:search:doc:<uuid>   hash term -> postings, packed int32
+#                                  (segment, word, start in centiseconds)
+#   wudpecker:search:meta:<uuid>  segment speakers and names for the hits
+# Terms are lowercased words with surrounding punctuation removed.
+
+TERM_PREFIX = "wudpecker:search:term:"
+DOC_PREFIX = "wudpecker:search:doc:"
+META_PREFIX = "wudpecker:search:meta:"
+TMP_PREFIX = "wudpecker:search:tmp:"
+
+_TOKEN = re.compile(r"\w+(?:['’]\w+)*")
+
+
+def enabled():
+    return os.getenv("SEARCH_INDEX", "").lower() in ("1", "true", "yes")
+
+
+def terms(text):
+    return [token.lower() for token in _TOKEN.findall(text)]
+
+
+def build(formatted):
+    # term -> array of (segment, word, centiseconds), plus the meta document
+    postings = {}
+    speakers = []
+    names = {}
+    word = 0
+    for number, segment in enumerate(formatted["results"]["speaker_labels"]["segments"]):
+        label = segment["speaker_label"]
+        speakers.append(label)
+        names.setdefault(label, segment.get("speaker_name", label))
+        for item in segment["items"]:
+            centis = int(round(float(item["start_time"]) * 100))
+            for term in terms(item["content"]):
+                postings.setdefault(term, array("i")).extend((number, word, centis))
+            word += 1
+    return postings, {"speakers": speakers, "names": names, "words": word}
+
+
+def index_transcript(uuid, formatted):
+    postings, meta = build(formatted)
+    client = get_redis()
+    old_terms = client.hkeys(DOC_PREFIX + uuid)
+    with client.pipeline() as pipe:
+        # re-indexing replaces the previous entry of the transcript
+        for term in old_terms:
+            pipe.zrem(TERM_PREFIX + term.decode(), uuid)
+        pipe.delete(DOC_PREFIX + uuid)
+        for term, packed in postings.items():
+            pipe.zadd(TERM_PREFIX + term, {uuid: len(packed) // 3})
+        if postings:
+            pipe.hset(DOC_PREFIX + uuid, mapping={term: packed.tobytes() for term, packed in postings.items()})
+        pipe.set(META_PREFIX + uuid, serialization.dumps(meta))
+        pipe.execute()
+    return len(postings)
+
+
+def remove_transcript(uuid):
+    client = get_redis()
+    old_terms = client.hkeys(DOC_PREFIX + uuid)
+    with client.pipeline() as pipe:
+        for term in old_terms:
+            pipe.zrem(TERM_PREFIX + term.decode(), uuid)
+        pipe.delete(DOC_PREFIX + uuid, META_PREFIX + uuid)
+        pipe.execute()
+
+
+def _matching(client, query_terms, offset, limit):
+    # (total, [(uuid, score)]) of transcripts containing every term
+    if len(query_terms) == 1:
+        key = TERM_PREFIX + query_terms[0]
+        with client.pipeline(transaction=False) as pipe:
+            pipe.zcard(key)
+            pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+            total, ranked = pipe.execute()
+        return total, ranked
+    tmp = TMP_PREFIX + uuidlib.uuid4().hex
+    with client.pipeline() as pipe:
+        pipe.zinterstore(tmp, [TERM_PREFIX + term for term in query_terms], aggregate="SUM")
+        pipe.zrevrange(tmp, offset, offset + limit - 1, withscores=True)
+        pipe.delete(tmp)
+        total, ranked, _ = pipe.execute()
+    return total, ranked
+
+
+def search(query, limit=20, hits=10, offset=0):
+    query_terms = list(dict.fromkeys(terms(query)))
+    if not query_terms:
+        return {"query": query, "terms": [], "total": 0, "results": []}
+    client = get_redis()
+    total, ranked = _matching(client, query_terms, offset, limit)
+
+    uuids = [member.decode() for member, _ in ranked]
+    with client.pipeline(transaction=False) as pipe:
+        for uuid in uuids:
+            pipe.hmget(DOC_PREFIX + uuid, query_terms)
+            pipe.get(META_PREFIX + uuid)
+        fetched = pipe.execute()
+
+    results = []
+    for i, (uuid, (_, score)) in enumerate(zip(uuids, ranked)):
+        packed_terms, meta = fetched[2 * i], fetched[2 * i + 1]
+        meta = serialization.loads(meta) if meta else {"speakers": [], "names": {}}
+        found = []
+        for term, packed in zip(query_terms, packed_terms):
+            if not packed:
+                continue
+            values = array("i")
+            values.frombytes(packed)
+            for j in range(0, len(values), 3):
+                segment, word, centis = values[j], values[j + 1], values[j + 2]
+                label = meta["speakers"][segment] if segment < len(meta["speakers"]) else None
+                found.append({"term": term, "time": centis / 100, "segment": segment, "word": word,
+                              "speaker_label": label, "speaker_name": meta["names"].get(label, label)})
+        found.sort(key=lambda hit: hit["time"])
+        results.append({"uuid": uuid, "score": score, "hits": found[:hits]})
+    return {"query": query, "terms": query_terms, "total": total, "results": results}
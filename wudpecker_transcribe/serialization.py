@@ -0,0 +1,57 @@
+import io
+import json
+import os
+
+# JSON encode/decode straight from and to bytes. Uses orjson or ujson when
+# installed (JSON_BACKEND picks one explicitly), the stdlib otherwise.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _pick_backend():
+    wanted = os.getenv("JSON_BACKEND", "").lower()
+    available = {"orjson": orjson, "ujson": ujson}
+    if wanted in available and available[wanted] is not None:
+        return wanted
+    if wanted == "json":
+        return "json"
+    return next((name for name, module in available.items() if module is not None), "json")
+
+
+BACKEND = _pick_backend()
+
+
+def loads(data):
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    if BACKEND == "ujson":
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    if BACKEND == "orjson":
+        return orjson.dumps(obj)
+    if BACKEND == "ujson":
+        return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj).encode("utf-8")
+
+
+def dump(obj, fileobj):
+    # the accelerated encoders are fast enough to build the bytes in one go,
+    # the stdlib encoder streams chunks into the file instead
+    if BACKEND != "json":
+        fileobj.write(dumps(obj))
+        return
+    text = io.TextIOWrapper(fileobj, encoding="utf-8")
+    json.dump(obj, text)
+    text.flush()
+    text.detach()
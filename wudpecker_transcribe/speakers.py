@@ -0,0 +1,90 @@
+import bisect
+
+# Recall timestamps and provider timestamps drift by a few seconds, a segment
+# that does not overlap any timeline event may still be matched to the event
+# starting closest to it within this window.
+RECALL_TOLERANCE = 4
+
+
+def label_index(label):
+    try:
+        return int(label.split('_')[-1])
+    except (ValueError, AttributeError):
+        return -1
+
+
+class RecallTimeline:
+    # Each Recall event marks the moment a participant started talking, so
+    # event i covers [timestamp_i, timestamp_i+1). Events are kept as parallel
+    # sorted lists so a lookup is a bisect plus a walk over the overlapping
+    # events only.
+
+    def __init__(self, events):
+        events = sorted(events, key=lambda e: float(e["timestamp"]))
+        self.starts = [float(e["timestamp"]) for e in events]
+        self.names = [e["name"] for e in events]
+        self.ends = self.starts[1:] + [float("inf")]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while i < len(self.starts) and self.starts[i] < end:
+            overlap = min(end, self.ends[i]) - max(start, self.starts[i])
+            if overlap > 0:
+                yield self.names[i], overlap
+            i += 1
+
+    def nearest(self, time, tolerance=RECALL_TOLERANCE):
+        i = bisect.bisect_left(self.starts, time)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self.starts):
+                distance = abs(self.starts[j] - time)
+                if distance <= tolerance and (best is None or distance < best[1]):
+                    best = (self.names[j], distance)
+        return best[0] if best else None
+
+
+def match_speakers(spans, timeline):
+    # spans: (speaker_label, start, end) for every transcript segment
+    weights = {}
+    for label, start, end in spans:
+        votes = weights.setdefault(label, {})
+
+        matched = False
+        for name, overlap in timeline.overlaps(start, end):
+            votes[name] = votes.get(name, 0) + overlap
+            matched = True
+        if not matched:
+            name = timeline.nearest(start)
+            if name is not None:
+                votes[name] = votes.get(name, 0) + max(end - start, 0)
+
+    result = []
+    for label in sorted(weights, key=label_index):
+        votes = weights[label]
+        if not votes:
+            continue
+        result.append({
+            "label": label,
+            "name": max(votes, key=votes.get),
+            "primary": "no",
+        })
+    return result
+
+
+def speaker_name_map(speakers_mapping):
+    # label -> name, the first entry of a label wins like the old linear lookup
+    names = {}
+    for speaker in speakers_mapping:
+        names.setdefault(speaker['label'], speaker.get("name", "Unknown"))
+    return names
+
+
+def speaker_name(label, names):
+    name = names.get(label, "Unknown")
+    if name == "Unknown":
+        return f"Speaker {label_index(label)+1}"
+    return name
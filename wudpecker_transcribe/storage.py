@@ -0,0 +1,54 @@
+import gzip
+import os
+import tempfile
+
+from wudpecker_transcribe import metrics, serialization
+
+# Process-wide S3 client plus a streaming JSON upload that serialises straight
+# into the upload body instead of building the whole document as str + bytes.
+
+S3_ENDPOINT = 'https://s3.eu-central-1.amazonaws.com'
+# documents up to this size are spooled in memory, bigger ones go to a temp file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+_client = None
+_client_pid = None
+
+
+def init_s3():
+    global _client, _client_pid
+    # boto3 takes longer to import than the rest of the app, only processes
+    # that talk to S3 pay for it
+    import boto3
+    session = boto3.session.Session()
+    _client = session.client("s3", endpoint_url=os.getenv("S3_ENDPOINT_URL", S3_ENDPOINT))
+    _client_pid = os.getpid()
+    return _client
+
+
+def get_s3():
+    if _client is None or _client_pid != os.getpid():
+        return init_s3()
+    return _client
+
+
+def gzip_enabled():
+    return os.getenv("S3_GZIP", "").lower() in ("1", "true", "yes")
+
+
+def upload_json(key, obj, bucket=None, compress=None):
+    if compress is None:
+        compress = gzip_enabled()
+    extra = {"ContentType": "application/json"}
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as body:
+        if compress:
+            with gzip.GzipFile(fileobj=body, mode="wb", compresslevel=6, mtime=0) as gz:
+                serialization.dump(obj, gz)
+            extra["ContentEncoding"] = "gzip"
+        else:
+            serialization.dump(obj, body)
+        metrics.S3_UPLOAD_BYTES.observe(body.tell())
+        body.seek(0)
+        # upload_fileobj switches to a multipart upload for large bodies
+        with metrics.S3_UPLOAD_SECONDS.time():
+            get_s3().upload_fileobj(body, bucket or os.getenv("BUCKET_NAME"), key, ExtraArgs=extra)
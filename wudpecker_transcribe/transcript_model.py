@@ -0,0 +1,131 @@
+import sys
+from array import array
+
+from wudpecker_transcribe.speakers import speaker_name
+
+# Internal columnar transcript: word and segment times live in parallel
+# arrays of doubles, speakers as small ints and word contents as interned
+# strings. The wudpecker JSON shape (per word dicts with string times) is
+# only built by to_wudpecker() right before upload.
+
+
+def deepgram_time(value):
+    return f"{value:.2f}"
+
+
+class Transcript:
+
+    def __init__(self, text, time_format=str, status=None):
+        self.text = text
+        self.time_format = time_format
+        self.status = status
+        self.speaker_count = 0
+
+        self.word_start = array('d')
+        self.word_end = array('d')
+        self.words = []
+
+        self.seg_start = array('d')
+        self.seg_end = array('d')
+        self.seg_speaker = array('i')
+        # index of the first word of every segment, words of segment i are
+        # words[seg_first_word[i]:seg_first_word[i + 1]]
+        self.seg_first_word = array('q')
+
+    def __len__(self):
+        return len(self.seg_start)
+
+    @property
+    def word_count(self):
+        return len(self.words)
+
+    def add_segment(self, speaker, start, end):
+        self.seg_start.append(start)
+        self.seg_end.append(end)
+        self.seg_speaker.append(speaker)
+        self.seg_first_word.append(len(self.words))
+
+    def add_word(self, start, end, content):
+        self.word_start.append(start)
+        self.word_end.append(end)
+        self.words.append(sys.intern(content))
+
+    def add_phrase(self, speaker, start, end, words):
+        # words: iterable of (start, end, content); merges into the previous
+        # segment when the speaker did not change
+        if not self.seg_speaker or self.seg_speaker[-1] != speaker:
+            self.add_segment(speaker, start, end)
+        else:
+            self.seg_end[-1] = end
+        for word_start, word_end, content in words:
+            self.add_word(word_start, word_end, content)
+
+    def segment_words(self, index):
+        first = self.seg_first_word[index]
+        last = self.seg_first_word[index + 1] if index + 1 < len(self.seg_first_word) else len(self.words)
+        return range(first, last)
+
+    def label(self, index):
+        return "spk_" + str(self.seg_speaker[index])
+
+    def speaker_spans(self):
+        # (label, start, end) per segment, used for speaker matching
+        for i in range(len(self.seg_start)):
+            yield self.label(i), self.seg_start[i], self.seg_end[i]
+
+    @classmethod
+    def from_deepgram(cls, data):
+        alternative = data["results"]["channels"][0]["alternatives"][0]
+        transcript = cls(alternative["transcript"], time_format=deepgram_time)
+        speakers = set()
+        for word in alternative["words"]:
+            speaker = word["speaker"]
+            speakers.add(speaker)
+            start = float(f"{word['start']:.2f}")
+            end = float(f"{word['end']:.2f}")
+            if not transcript.seg_speaker or transcript.seg_speaker[-1] != speaker:
+                transcript.add_segment(speaker, start, end)
+            else:
+                transcript.seg_end[-1] = end
+            transcript.add_word(start, end, word["punctuated_word"])
+        transcript.speaker_count = len(speakers)
+        return transcript
+
+    def to_wudpecker(self, speaker_names=None):
+        # speaker_names: label -> name, adds speaker_name to every segment
+        fmt = self.time_format
+        word_start = self.word_start
+        word_end = self.word_end
+        words = self.words
+        segments = []
+        display_names = {}
+        for i in range(len(self.seg_start)):
+            label = self.label(i)
+            segment = {
+                "start_time": fmt(self.seg_start[i]),
+                "end_time": fmt(self.seg_end[i]),
+                "speaker_label": label,
+                "items": [{
+                    "start_time": fmt(word_start[w]),
+                    "end_time": fmt(word_end[w]),
+                    "speaker_label": label,
+                    "content": words[w],
+                } for w in self.segment_words(i)],
+            }
+            if speaker_names is not None:
+                if label not in display_names:
+                    display_names[label] = speaker_name(label, speaker_names)
+                segment["speaker_name"] = display_names[label]
+            segments.append(segment)
+        formatted = {
+            "results": {
+                "transcripts": [{"transcript": self.text}],
+                "speaker_labels": {
+                    "speakers": self.speaker_count,
+                    "segments": segments,
+                },
+            },
+        }
+        if self.status:
+            formatted["status"] = self.status
+        return formatted
@@ -0,0 +1,131 @@
+import gzip
+import io
+import os
+
+from wudpecker_transcribe import serialization, storage
+
+# Time addressable transcript layout, written next to <uuid>_final_.json when
+# S3_WINDOWED_LAYOUT is on:
+#   <uuid>_final_.windows       gzip members, one per TRANSCRIPT_WINDOW_SECONDS
+#                               window, holding the segments starting in it
+#   <uuid>_final_.index.json.gz speakers, a transcript summary and the byte
+#                               range and time span of every window
+# A reader fetches the small header and then only the windows overlapping
+# the requested time range with one ranged GET.
+
+LAYOUT_VERSION = 1
+SUMMARY_CHARS = 500
+
+
+class TranscriptNotFound(Exception):
+    pass
+
+
+def enabled():
+    return os.getenv("S3_WINDOWED_LAYOUT", "").lower() in ("1", "true", "yes")
+
+
+def header_key(uuid):
+    return uuid + "_final_.index.json.gz"
+
+
+def windows_key(uuid):
+    return uuid + "_final_.windows"
+
+
+def build(uuid, formatted, window):
+    # (header, windows body)
+    results = formatted["results"]
+    segments = results["speaker_labels"]["segments"]
+    windows = {}
+    for segment in segments:
+        windows.setdefault(int(float(segment["start_time"]) // window), []).append(segment)
+
+    body = io.BytesIO()
+    index = []
+    for number in sorted(windows):
+        members = windows[number]
+        chunk = gzip.compress(serialization.dumps(members), compresslevel=6, mtime=0)
+        index.append({
+            "start": number * window,
+            "end": (number + 1) * window,
+            # segments may run past the end of their window
+            "last_end": max(float(segment["end_time"]) for segment in members),
+            "offset": body.tell(),
+            "length": len(chunk),
+            "segments": len(members),
+            "words": sum(len(segment["items"]) for segment in members),
+        })
+        body.write(chunk)
+
+    speakers = {}
+    for segment in segments:
+        speakers.setdefault(segment["speaker_label"], segment.get("speaker_name"))
+    transcripts = results.get("transcripts") or [{}]
+    text = transcripts[0].get("transcript") or ""
+    header = {
+        "version": LAYOUT_VERSION,
+        "uuid": uuid,
+        "status": formatted.get("status"),
+        "window": window,
+        "speaker_count": results["speaker_labels"].get("speakers"),
+        "speakers": [{"label": label, "name": name} for label, name in speakers.items()],
+        "segments": len(segments),
+        "words": sum(entry["words"] for entry in index),
+        "duration": max((entry["last_end"] for entry in index), default=0.0),
+        "summary": text[:SUMMARY_CHARS],
+        "windows": index,
+    }
+    return header, body.getvalue()
+
+
+def write(uuid, formatted, bucket=None, window=None):
+    window = window or float(os.getenv("TRANSCRIPT_WINDOW_SECONDS", 300))
+    bucket = bucket or os.getenv("BUCKET_NAME")
+    header, body = build(uuid, formatted, window)
+    s3 = storage.get_s3()
+    # header last, a reader never sees an index pointing at missing windows
+    s3.put_object(Bucket=bucket, Key=windows_key(uuid), Body=body, ContentType="application/octet-stream")
+    s3.put_object(Bucket=bucket, Key=header_key(uuid), ContentType="application/json", ContentEncoding="gzip",
+                  Body=gzip.compress(serialization.dumps(header), compresslevel=6, mtime=0))
+    return header
+
+
+def _get(bucket, key, **kwargs):
+    s3 = storage.get_s3()
+    try:
+        return s3.get_object(Bucket=bucket, Key=key, **kwargs)["Body"].read()
+    except s3.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            raise TranscriptNotFound(key)
+        raise
+
+
+def read_header(uuid, bucket=None):
+    bucket = bucket or os.getenv("BUCKET_NAME")
+    return serialization.loads(gzip.decompress(_get(bucket, header_key(uuid))))
+
+
+def read_range(uuid, start=0.0, end=None, bucket=None):
+    bucket = bucket or os.getenv("BUCKET_NAME")
+    header = read_header(uuid, bucket)
+    wanted = [entry for entry in header["windows"]
+              if entry["last_end"] > start and (end is None or entry["start"] < end)]
+    segments = []
+    if wanted:
+        first = wanted[0]["offset"]
+        last = wanted[-1]["offset"] + wanted[-1]["length"]
+        data = _get(bucket, windows_key(uuid), Range=f"bytes={first}-{last - 1}")
+        for entry in wanted:
+            chunk = data[entry["offset"] - first:entry["offset"] - first + entry["length"]]
+            for segment in serialization.loads(gzip.decompress(chunk)):
+                if float(segment["end_time"]) > start and (end is None or float(segment["start_time"]) < end):
+                    segments.append(segment)
+    return {
+        "uuid": uuid,
+        "start": start,
+        "end": end,
+        "duration": header["duration"],
+        "speakers": header["speakers"],
+        "segments": segments,
+    }